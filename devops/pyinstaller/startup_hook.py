@@ -0,0 +1,14 @@
+"""
+PyInstaller runtime hook. It runs before main.py and its imports, so the game
+can report its startup time from here instead of from its own first line.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+setattr(sys, "_wibblo_started", time.perf_counter())
+# Trace the allocations of the imports too (see startup.py)
+if os.environ.get("WIBBLO_STARTUP_TRACE"):
+    tracemalloc.start()
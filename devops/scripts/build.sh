@@ -8,6 +8,11 @@ if [ -z "$VIRTUAL_ENV" ]; then
     exit 1
 fi
 
+echo 'Compiling the levels...'
+python src/level.py src/levels/*.json
+
 echo 'Building the game with PyInstaller...'
-pyinstaller --collect-all pgzero --windowed --onefile --clean src/main.py --name wibblo --add-data "src/images:images" --add-data "src/sounds:sounds" --add-data "src/fonts:fonts"
-# pyinstaller --clean wibblo.spec
\ No newline at end of file
+pyinstaller --clean --noconfirm wibblo.spec
+
+echo 'Archiving the build for release...'
+tar -czf dist/wibblo.tar.gz -C dist wibblo
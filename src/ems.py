@@ -1,29 +1,178 @@
-import uuid
+import itertools
+import random
+import struct
+import time
+import tracemalloc
 from collections import defaultdict
-from typing import List, Set, Type
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 # region ECS
 
 
-class Entity:
-    """A simple class to represent an entity. It's just a unique ID."""
+_next_uid = itertools.count(1)
 
-    def __init__(self):
-        self.uid = str(uuid.uuid4())
 
-    def __hash__(self):
-        return hash(self.uid)
+class Entity(int):
+    """
+    A simple class to represent an entity. It's just a unique ID, stored as an
+    int so hashing it in component lookups stays in C.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, uid: int | None = None):
+        return super().__new__(cls, uid if uid is not None else next(_next_uid))
+
+    @property
+    def uid(self) -> int:
+        return int(self)
+
+    def __repr__(self):
+        return f"Entity({int(self)})"
+
+
+# Change ticks: bumped before each stage of systems runs, and stamped on the
+# components added or changed while it runs
+_tick = 0
+
+
+def _advance_tick() -> int:
+    global _tick
+    _tick += 1
+    return _tick
+
+
+_UNSET = object()
+
 
-    def __eq__(self, other):
-        return isinstance(other, Entity) and self.uid == other.uid
+def _tracked_setattr(self, name: str, value: Any):
+    if name in self.tracked:
+        old = self.__dict__.get(name, _UNSET)
+        if old is _UNSET or old != value:
+            object.__setattr__(self, "changed", _tick)
+    object.__setattr__(self, name, value)
 
 
 class Component:
     """
     A base class for all components. Components are data containers.
+
+    A subclass can list the fields whose changes queries can filter on with
+    Changed, e.g. 'class Sprite(Component, tracked=("texture",))'. Assigning
+    a different value to one of them marks the component changed.
     """
 
-    pass
+    # Ticks when the component was added to a world and last changed, kept
+    # out of __dict__ so snapshots leave them out
+    __slots__ = ("added", "changed")
+    added: int
+    changed: int
+
+    # Component types by name, used to rebuild components from snapshots
+    registry: Dict[str, Type["Component"]] = {}
+
+    # Transient components are left out of snapshots and kept on restore
+    transient = False
+
+    tracked: FrozenSet[str] = frozenset()
+
+    def __init_subclass__(cls, tracked: Iterable[str] = (), **kwargs):
+        super().__init_subclass__(**kwargs)
+        Component.registry[cls.__qualname__] = cls
+        if tracked:
+            cls.tracked = cls.tracked | frozenset(tracked)
+            setattr(cls, "__setattr__", _tracked_setattr)
+
+    def mark_changed(self):
+        """Marks the component changed, e.g. after mutating a field in place."""
+        self.changed = _tick
+
+
+class Changed:
+    """
+    Query filter for the entities whose component of a type was added or
+    changed since a tick, usually the system's 'last_run', e.g.
+    'world.get_matching_entities({Changed[Sprite]}, since=self.last_run)'.
+    """
+
+    __slots__ = ("component_type",)
+
+    def __init__(self, component_type: Type[Component]):
+        self.component_type = component_type
+
+    def __class_getitem__(cls, component_type: Type[Component]) -> "Changed":
+        return cls(component_type)
+
+    def matches(self, component: Component, since: int) -> bool:
+        return component.changed > since
+
+
+class Added(Changed):
+    """Query filter for the entities whose component of a type was added."""
+
+    __slots__ = ()
+
+    def matches(self, component: Component, since: int) -> bool:
+        return component.added > since
+
+
+class Event:
+    """
+    Base class of the events systems publish on a World. Handlers subscribed
+    to an event type get the events of that type in one batch per update.
+    """
+
+    __slots__ = ()
+
+
+EventHandler = Callable[[List[Any]], None]
+
+R = TypeVar("R")
+
+
+class Resources:
+    """
+    One-of-a-kind objects, like asset caches or the audio mixer, stored by
+    their type so systems fetch them without querying for an entity. What
+    isn't found is looked up in 'parent', e.g. the resources a world shares
+    with the other worlds of a SceneManager.
+    """
+
+    def __init__(self, parent: "Resources | None" = None):
+        self.parent = parent
+        self.values: Dict[Type, Any] = {}
+
+    def insert(self, value: Any):
+        """Stores 'value' as the resource of its type, replacing any other."""
+        self.values[type(value)] = value
+
+    def get(self, resource_type: Type[R]) -> R | None:
+        value = self.values.get(resource_type)
+        if value is None and self.parent is not None:
+            return self.parent.get(resource_type)
+        return value
+
+    def remove(self, resource_type: Type[R]) -> R | None:
+        """Removes a resource of this store, never one of its parent."""
+        value: R | None = self.values.pop(resource_type, None)
+        return value
+
+    def __contains__(self, resource_type: Type) -> bool:
+        return resource_type in self.values or (
+            self.parent is not None and resource_type in self.parent
+        )
 
 
 class System:
@@ -31,8 +180,21 @@ class System:
     A base class for all systems. Systems contain the logic.
     """
 
+    # Component types the system reads and writes in update(). None means the
+    # access is unknown (or the system creates and destroys entities), so the
+    # system never runs alongside another one.
+    reads: Set[Type[Component]] | None = None
+    writes: Set[Type[Component]] | None = None
+    # Resource types it reads and writes, see Resources, like the audio
+    # queue its sounds go to
+    resource_reads: Set[Type] = set()
+    resource_writes: Set[Type] = set()
+
     def __init__(self, world):
         self.world = world
+        # Tick of the stage the system last updated in; what it sees as
+        # Changed next is what changed after it
+        self.last_run = 0
 
     def update(self, dt: float):
         """
@@ -49,6 +211,22 @@ class System:
         """
         pass
 
+    def conflicts_with(self, other: "System") -> bool:
+        """Whether the two systems can't safely update at the same time."""
+        if (
+            self.reads is None
+            or self.writes is None
+            or other.reads is None
+            or other.writes is None
+        ):
+            return True
+        return bool(
+            self.writes & (other.reads | other.writes)
+            or other.writes & self.reads
+            or self.resource_writes & (other.resource_reads | other.resource_writes)
+            or other.resource_writes & self.resource_reads
+        )
+
 
 class World:
     """
@@ -56,72 +234,953 @@ class World:
     It orchestrates the entire simulation.
     """
 
-    def __init__(self):
-        self.entities = set()
+    def __init__(
+        self, executor: Executor | None = None, resources: Resources | None = None
+    ):
+        # Entities in creation order, so queries iterate deterministically
+        self.entities: Dict[Entity, None] = {}
         # A dictionary to store components.
         # { component_type: { entity_id: component_instance } }
-        self.components = defaultdict(dict)
-        self.systems = []
+        self.components: Dict[Type[Component], Dict[Entity, Component]] = defaultdict(
+            dict
+        )
+        # Bumped whenever entities join or leave a component store, so caches
+        # built from a store know when to rebuild
+        self.versions: Dict[Type[Component], int] = defaultdict(int)
+        self.systems: List[System] = []
+        # Runs the systems of a stage concurrently when set
+        self.executor = executor
+        self._stages: List[List[System]] | None = None
+        # Attributes allocations to systems when set, see AllocationProfiler
+        self.profiler: "AllocationProfiler | None" = None
+        # Events published since the last dispatch, and their handlers by type
+        self.events: List[Event] = []
+        self.handlers: Dict[Type[Event], List[EventHandler]] = defaultdict(list)
+        # The world's own resources, over those given, usually shared with
+        # the other worlds of a SceneManager
+        self.resources = Resources(resources)
+        # The entity get_single found for a type, and its store's version then
+        self._singles: Dict[Type[Component], Tuple[int, Entity | None]] = {}
 
     def create_entity(self) -> Entity:
         """Creates a new entity and adds it to the world."""
         entity = Entity()
-        self.entities.add(entity)
+        self.entities[entity] = None
         return entity
 
+    def create_entities(
+        self, count: int, columns: Iterable[List[Component]]
+    ) -> List[Entity]:
+        """
+        Creates many entities at once. Each column is a list of 'count'
+        components of one type, the i-th of which goes to the i-th entity.
+        """
+        entities = [Entity() for _ in range(count)]
+        self.entities.update(dict.fromkeys(entities))
+        for column in columns:
+            if len(column) != count:
+                raise ValueError(f"Expected {count} components, got {len(column)}")
+            if not count:
+                continue
+            for component in column:
+                component.added = component.changed = _tick
+            component_type = type(column[0])
+            self.components[component_type].update(zip(entities, column))
+            self.versions[component_type] += 1
+        return entities
+
     def destroy_entity(self, entity: Entity):
         """Removes an entity and all its components from the world."""
         if entity in self.entities:
-            self.entities.remove(entity)
+            del self.entities[entity]
             for component_type in list(self.components.keys()):
                 if entity in self.components[component_type]:
                     del self.components[component_type][entity]
+                    self.versions[component_type] += 1
 
     def add_component(self, entity: Entity, component: Component):
         """Adds a component to an entity."""
         component_type = type(component)
-        self.components[component_type][entity] = component
+        store = self.components[component_type]
+        if entity not in store:
+            self.versions[component_type] += 1
+        component.added = component.changed = _tick
+        store[entity] = component
 
     def get_component(self, entity: Entity, component_type: Type[Component]):
         """Retrieves a component from an entity."""
-        return self.components[component_type].get(entity)
+        store = self.components.get(component_type)
+        return store.get(entity) if store is not None else None
 
     def remove_component(self, entity: Entity, component_type: Type[Component]):
         """Removes a component from an entity."""
         if entity in self.components[component_type]:
             del self.components[component_type][entity]
+            self.versions[component_type] += 1
+
+    def get_single(self, component_type: Type[Component]) -> Entity | None:
+        """
+        The entity with a component of 'component_type', for types only one
+        entity has, like the player's. The entity is cached until another one
+        joins or leaves the store, so the lookup costs O(1).
+        """
+        version = self.versions.get(component_type, 0)
+        single = self._singles.get(component_type)
+        if single is None or single[0] != version:
+            store = self.components.get(component_type)
+            single = (version, next(iter(store), None) if store else None)
+            self._singles[component_type] = single
+        return single[1]
+
+    def get_single_component(self, component_type: Type[Component]):
+        """The component of the entity 'get_single' finds, if any."""
+        entity = self.get_single(component_type)
+        return None if entity is None else self.components[component_type][entity]
 
     def add_system(self, system: System):
         """Adds a system to the world."""
         self.systems.append(system)
+        self._stages = None
 
     def remove_system(self, system: System):
         """Removes a system from the world."""
         self.systems.remove(system)
+        self._stages = None
+
+    def archetypes(self) -> Dict[FrozenSet[Type[Component]], int]:
+        """Counts the entities of each combination of component types."""
+        types: Dict[Entity, List[Type[Component]]] = {e: [] for e in self.entities}
+        for component_type, store in self.components.items():
+            for entity in store:
+                types[entity].append(component_type)
+        counts: Dict[FrozenSet[Type[Component]], int] = defaultdict(int)
+        for component_types in types.values():
+            counts[frozenset(component_types)] += 1
+        return dict(counts)
+
+    def get_stages(self) -> List[List[System]]:
+        """
+        Splits the systems into stages that run one after another. The systems
+        of a stage are contiguous in the system list and don't conflict with
+        each other, so running them concurrently gives the same result as
+        running them in order.
+        """
+        if self._stages is None:
+            stages: List[List[System]] = []
+            for system in self.systems:
+                if stages and not any(
+                    system.conflicts_with(other) for other in stages[-1]
+                ):
+                    stages[-1].append(system)
+                else:
+                    stages.append([system])
+            self._stages = stages
+        return self._stages
 
     def get_matching_entities(
-        self, component_types: Set[Type[Component]]
+        self,
+        component_types: Set[Type[Component] | Changed],
+        exclude: Set[Type[Component]] | None = None,
+        since: int = 0,
     ) -> List[Entity]:
         """
-        Returns a list of entities that have all the specified components.
+        Returns a list of entities that have all the specified components and
+        none of the excluded ones. Changed and Added filters among the
+        component types keep only the entities whose component changed or
+        was added after the tick 'since'.
         This is a key part of the ECS pattern.
+        The order is deterministic: it follows the order in which the
+        components of the rarest type were added.
         """
-        matching_entities = set(self.entities)
+        stores = []
+        filters = []
         for component_type in component_types:
-            if not self.components[component_type]:
+            if isinstance(component_type, Changed):
+                filters.append(component_type)
+                component_type = component_type.component_type
+            store = self.components.get(component_type)
+            if not store:
                 return []
-            matching_entities &= set(self.components[component_type].keys())
-        return list(matching_entities)
+            stores.append((len(store), component_type.__qualname__, store))
+        if stores:
+            stores.sort(key=lambda item: item[:2])
+            smallest = stores[0][2]
+            others = [store for _, _, store in stores[1:]]
+            matches = [e for e in smallest if all(e in store for store in others)]
+        else:
+            matches = list(self.entities)
+        if exclude:
+            excluded = [self.components[t] for t in exclude if self.components.get(t)]
+            if excluded:
+                matches = [
+                    e for e in matches if not any(e in store for store in excluded)
+                ]
+        for change in filters:
+            store = self.components[change.component_type]
+            matches = [e for e in matches if change.matches(store[e], since)]
+        return matches
+
+    def snapshot(self) -> bytes:
+        """
+        Encodes all entities and non-transient components into a compact
+        binary snapshot that 'restore' can load back.
+        """
+        return encode_snapshot(self)
+
+    def restore(self, data: bytes):
+        """
+        Replaces the entities and components with those of a snapshot.
+        Transient components are kept for the entities that still exist.
+        """
+        entities, components = decode_snapshot(data)
+        for component_type, store in self.components.items():
+            if component_type.transient:
+                components[component_type] = {
+                    e: c for e, c in store.items() if e in entities
+                }
+        for component_type in set(self.components) | set(components):
+            self.versions[component_type] += 1
+        # Everything restored counts as added, so caches rebuild from it
+        for store in components.values():
+            for component in store.values():
+                component.added = component.changed = _tick
+        self.entities = entities
+        self.components = defaultdict(dict, components)
+
+    def subscribe(self, event_type: Type[Event], handler: EventHandler):
+        """Calls 'handler' with the list of events of 'event_type' each update."""
+        self.handlers[event_type].append(handler)
+
+    def unsubscribe(self, event_type: Type[Event], handler: EventHandler):
+        self.handlers[event_type].remove(handler)
+
+    def publish(self, event: Event):
+        """
+        Queues an event until the end of the update. Systems of the same stage
+        may publish concurrently, so their events may interleave in any order.
+        """
+        self.events.append(event)
+
+    def dispatch_events(self):
+        """
+        Hands the queued events to their handlers, a batch per event type, in
+        the order each type was first published. Events published by handlers
+        wait for the next dispatch.
+        """
+        if not self.events:
+            return
+        events, self.events = self.events, []
+        batches: Dict[Type[Event], List[Event]] = {}
+        for event in events:
+            batches.setdefault(type(event), []).append(event)
+        for event_type, batch in batches.items():
+            for handler in list(self.handlers.get(event_type, ())):
+                handler(batch)
 
     def update(self, dt: float):
-        """The main loop that updates all systems."""
-        for system in self.systems:
-            system.update(dt)
+        """
+        The main loop that updates all systems, then dispatches the events
+        they published.
+        """
+        if self.profiler is not None:
+            # Serially, since allocations can only be told apart one at a time
+            for system in self.systems:
+                tick = _advance_tick()
+                self.profiler.call(system.update, dt)
+                system.last_run = tick
+        elif self.executor is None:
+            for system in self.systems:
+                tick = _advance_tick()
+                system.update(dt)
+                system.last_run = tick
+        else:
+            for stage in self.get_stages():
+                tick = _advance_tick()
+                if len(stage) == 1:
+                    stage[0].update(dt)
+                else:
+                    futures = [self.executor.submit(s.update, dt) for s in stage[1:]]
+                    stage[0].update(dt)
+                    for future in futures:
+                        future.result()
+                for system in stage:
+                    system.last_run = tick
+        # Changes made from here to the next update are new to every system
+        _advance_tick()
+        self.dispatch_events()
 
     def draw(self):
         """Run only render systems for drawing"""
+        if self.profiler is not None:
+            for system in self.systems:
+                self.profiler.call(system.draw)
+            return
+
         for system in self.systems:
             system.draw()
 
 
 # endregion
+
+# region Scenes
+
+
+class Scene:
+    """
+    A world run by a SceneManager. Only the scene on top of the stack updates,
+    the ones below are paused and cost nothing per frame. An overlay scene is
+    drawn over the scenes below it, frozen as they were left.
+    """
+
+    # Drawn over the scenes below it instead of hiding them
+    overlay = False
+
+    def __init__(self, world: World):
+        self.world = world
+
+    def enter(self):
+        """Called when the scene is pushed on the stack."""
+
+    def exit(self):
+        """Called when the scene leaves the stack."""
+
+    def pause(self):
+        """Called when another scene is pushed over this one."""
+
+    def resume(self):
+        """Called when the scene is back on top of the stack."""
+
+    def update(self, dt: float):
+        self.world.update(dt)
+
+    def draw(self):
+        self.world.draw()
+
+
+class SceneManager:
+    """
+    A stack of scenes and the resources they share, like textures and audio.
+    Scenes may push, pop or switch scenes from their own update, the new top
+    scene updates from the next frame.
+    """
+
+    def __init__(self, resources: Resources | None = None):
+        self.resources = resources if resources is not None else Resources()
+        self.stack: List[Scene] = []
+
+    @property
+    def top(self) -> Scene | None:
+        return self.stack[-1] if self.stack else None
+
+    def push(self, scene: Scene):
+        """Pauses the top scene and puts 'scene' over it."""
+        if self.stack:
+            self.stack[-1].pause()
+        self.stack.append(scene)
+        scene.enter()
+
+    def pop(self) -> Scene:
+        """Removes the top scene and resumes the one below."""
+        scene = self.stack.pop()
+        scene.exit()
+        if self.stack:
+            self.stack[-1].resume()
+        return scene
+
+    def switch(self, scene: Scene):
+        """Replaces every scene of the stack with 'scene'."""
+        while self.stack:
+            self.stack.pop().exit()
+        self.push(scene)
+
+    def update(self, dt: float):
+        if self.stack:
+            self.stack[-1].update(dt)
+
+    def draw(self):
+        # From the topmost scene that hides the ones below it
+        first = len(self.stack) - 1
+        while first > 0 and self.stack[first].overlay:
+            first -= 1
+        for scene in self.stack[max(first, 0) :]:
+            scene.draw()
+
+
+# endregion
+
+# region Spatial
+
+
+class SpatialHash:
+    """
+    Buckets axis-aligned boxes into a uniform grid, so a broadphase query only
+    looks at the boxes in the cells it covers.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Entity]] = defaultdict(list)
+        # Insertion order, so queries return their entities deterministically
+        self.order: Dict[Entity, int] = {}
+
+    def clear(self):
+        self.cells.clear()
+        self.order.clear()
+
+    def _cell_range(self, x: float, y: float, width: float, height: float):
+        size = self.cell_size
+        return (
+            range(int(x // size), int((x + width) // size) + 1),
+            range(int(y // size), int((y + height) // size) + 1),
+        )
+
+    def insert(self, entity: Entity, x: float, y: float, width: float, height: float):
+        """Adds an entity's box to every cell it covers."""
+        self.order.setdefault(entity, len(self.order))
+        columns, rows = self._cell_range(x, y, width, height)
+        for cx in columns:
+            for cy in rows:
+                self.cells[(cx, cy)].append(entity)
+
+    def query(self, x: float, y: float, width: float, height: float) -> List[Entity]:
+        """
+        Returns the entities in the cells covered by the box, in insertion
+        order. They may not overlap the box themselves.
+        """
+        found: Set[Entity] = set()
+        columns, rows = self._cell_range(x, y, width, height)
+        for cx in columns:
+            for cy in rows:
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return sorted(found, key=self.order.__getitem__)
+
+
+def sweep_aabb(
+    ax: float,
+    ay: float,
+    aw: float,
+    ah: float,
+    dx: float,
+    dy: float,
+    bx: float,
+    by: float,
+    bw: float,
+    bh: float,
+) -> Tuple[float, str | None]:
+    """
+    Sweeps box a by (dx, dy) against the still box b. Returns the fraction of
+    the move at which they first touch and the axis ("x" or "y") they touch
+    on, or (1.0, None) if the move doesn't hit b. Boxes that already overlap
+    don't count as a hit.
+    """
+    if dx > 0:
+        x_entry = (bx - (ax + aw)) / dx
+        x_exit = (bx + bw - ax) / dx
+    elif dx < 0:
+        x_entry = (bx + bw - ax) / dx
+        x_exit = (bx - (ax + aw)) / dx
+    elif ax < bx + bw and ax + aw > bx:
+        x_entry, x_exit = float("-inf"), float("inf")
+    else:
+        return 1.0, None
+
+    if dy > 0:
+        y_entry = (by - (ay + ah)) / dy
+        y_exit = (by + bh - ay) / dy
+    elif dy < 0:
+        y_entry = (by + bh - ay) / dy
+        y_exit = (by - (ay + ah)) / dy
+    elif ay < by + bh and ay + ah > by:
+        y_entry, y_exit = float("-inf"), float("inf")
+    else:
+        return 1.0, None
+
+    entry = max(x_entry, y_entry)
+    if entry >= min(x_exit, y_exit) or entry < 0 or entry >= 1:
+        return 1.0, None
+    return entry, "x" if x_entry > y_entry else "y"
+
+
+# endregion
+
+# region Diagnostics
+
+
+class AllocationStats:
+    def __init__(self):
+        self.calls = 0
+        self.allocated = 0  # net bytes left allocated, over all calls
+        self.peak = 0  # sum of each call's peak
+        self.max_peak = 0
+
+
+class AllocationProfiler:
+    """
+    Attributes memory allocations to the systems of the worlds that use it,
+    with tracemalloc. Each call records the bytes it left allocated and its
+    peak above where it started, which counts the temporaries freed before it
+    returned too. Tracing slows everything down, so it's for diagnostics only.
+    """
+
+    def __init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # By "<system type>.<method>"
+        self.stats: Dict[str, AllocationStats] = defaultdict(AllocationStats)
+
+    def call(self, method, *args):
+        """Calls a system's bound method and records its allocations."""
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        method(*args)
+        current, peak = tracemalloc.get_traced_memory()
+
+        stats = self.stats[f"{type(method.__self__).__name__}.{method.__name__}"]
+        stats.calls += 1
+        stats.allocated += current - start
+        stats.peak += peak - start
+        stats.max_peak = max(stats.max_peak, peak - start)
+
+    def report(self) -> str:
+        """A table of the allocations per call, biggest first."""
+        lines = [
+            f"{'system':<40} {'calls':>7} {'net B':>9} {'peak B':>9} "
+            f"{'max peak B':>11}"
+        ]
+        rows = sorted(self.stats.items(), key=lambda item: -item[1].peak)
+        for name, stats in rows:
+            calls = max(stats.calls, 1)
+            lines.append(
+                f"{name:<40} {stats.calls:>7} {stats.allocated / calls:>9.0f} "
+                f"{stats.peak / calls:>9.0f} {stats.max_peak:>11}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+# endregion
+
+# region Snapshot
+
+_SNAPSHOT_MAGIC = b"EMS2"
+
+# Value tags
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR = range(6)
+_TUPLE, _LIST, _DICT, _SET, _ENTITY, _RANDOM = range(6, 12)
+
+# Column layouts: a whole field column is packed at once when its values
+# share a simple type, and falls back to tagged values otherwise
+_COLUMN_FLOAT, _COLUMN_INT, _COLUMN_BOOL, _COLUMN_STR = range(4)
+_COLUMN_NUMBER, _COLUMN_TAGGED = range(4, 6)
+
+_FLAT_KINDS = frozenset((str, int, float, bool, type(None)))
+
+_DOUBLE = struct.Struct("<d")
+_RANDOM_STATE = struct.Struct("<625I")
+
+
+def _write_uint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_uint(data: bytes, pos: int) -> Tuple[int, int]:
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_snapshot(world: "World") -> bytes:
+    """
+    Encodes a world as: the string table, the entity ids, then the components
+    grouped by type and field layout, stored column by column.
+    """
+    strings: Dict[str, int] = {}
+    memo: Dict[Tuple[type, tuple, tuple], bytes] = {}
+    body = bytearray()
+
+    def string_index(text: str) -> int:
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    def write_value(value: Any):
+        kind = type(value)
+        if kind is float:
+            body.append(_FLOAT)
+            body.extend(_DOUBLE.pack(value))
+        elif kind is str:
+            body.append(_STR)
+            _write_uint(body, string_index(value))
+        elif value is None:
+            body.append(_NONE)
+        elif kind is bool:
+            body.append(_TRUE if value else _FALSE)
+        elif kind is Entity:
+            body.append(_ENTITY)
+            _write_uint(body, value.uid)
+        elif isinstance(value, int):
+            body.append(_INT)
+            _write_uint(body, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif kind is tuple or kind is list or kind is set or kind is frozenset:
+            body.append(_TUPLE if kind is tuple else _LIST if kind is list else _SET)
+            _write_uint(body, len(value))
+            for item in value:
+                write_value(item)
+        elif kind is dict:
+            body.append(_DICT)
+            _write_uint(body, len(value))
+            for key, item in value.items():
+                write_value(key)
+                write_value(item)
+        elif kind is random.Random:
+            version, state, gauss_next = value.getstate()
+            body.append(_RANDOM)
+            _write_uint(body, version)
+            body.extend(_RANDOM_STATE.pack(*state))
+            write_value(gauss_next)
+        else:
+            raise TypeError(f"Cannot snapshot value of type {kind.__name__}")
+
+    def write_column(column: List[Any]):
+        count = len(column)
+        kinds = set(map(type, column))
+        if kinds == {float}:
+            body.append(_COLUMN_FLOAT)
+            body.extend(struct.pack(f"<{count}d", *column))
+        elif kinds == {int} and -(2**63) <= min(column) and max(column) < 2**63:
+            # Ints past 64 bits, like hashes, fall back to tagged varints
+            body.append(_COLUMN_INT)
+            body.extend(struct.pack(f"<{count}q", *column))
+        elif kinds == {int, float} and all(
+            -(2**53) <= value <= 2**53 for value in column
+        ):
+            # Ints and floats mixed, e.g. positions that started as ints
+            body.append(_COLUMN_NUMBER)
+            body.extend(struct.pack(f"<{count}d", *column))
+            body.extend(bytes(type(value) is int for value in column))
+        elif kinds == {bool}:
+            body.append(_COLUMN_BOOL)
+            body.extend(bytes(column))
+        elif kinds == {str}:
+            body.append(_COLUMN_STR)
+            indices = [strings.get(text) for text in column]
+            if None in indices:
+                indices = [string_index(text) for text in column]
+            body.extend(struct.pack(f"<{count}I", *indices))
+        else:
+            body.append(_COLUMN_TAGGED)
+            for value in column:
+                kind = type(value)
+                if kind is not tuple and kind is not list:
+                    write_value(value)
+                    continue
+                # Flat sequences (sizes, offsets, frame names) repeat a lot
+                item_kinds = tuple(map(type, value))
+                if not _FLAT_KINDS.issuperset(item_kinds):
+                    write_value(value)
+                    continue
+                key = (kind, tuple(value), item_kinds)
+                encoded = memo.get(key)
+                if encoded is None:
+                    start = len(body)
+                    write_value(value)
+                    memo[key] = bytes(body[start:])
+                else:
+                    body.extend(encoded)
+
+    order = {entity: i for i, entity in enumerate(world.entities)}
+    _write_uint(body, len(order))
+    body.extend(struct.pack(f"<{len(order)}Q", *[e.uid for e in order]))
+
+    groups: Dict[Tuple[type, Tuple[str, ...]], List[Tuple[int, Any]]] = {}
+    for component_type, store in world.components.items():
+        if component_type.transient:
+            continue
+        for entity, component in store.items():
+            fields = tuple(component.__dict__)
+            groups.setdefault((component_type, fields), []).append(
+                (order[entity], component.__dict__)
+            )
+
+    _write_uint(body, len(groups))
+    for (component_type, fields), members in groups.items():
+        _write_uint(body, string_index(component_type.__qualname__))
+        _write_uint(body, len(fields))
+        for field in fields:
+            _write_uint(body, string_index(field))
+        count = len(members)
+        _write_uint(body, count)
+        body.extend(struct.pack(f"<{count}I", *[index for index, _ in members]))
+        for field in fields:
+            write_column([values[field] for _, values in members])
+
+    head = bytearray(_SNAPSHOT_MAGIC)
+    _write_uint(head, len(strings))
+    for text in strings:
+        encoded = text.encode()
+        _write_uint(head, len(encoded))
+        head.extend(encoded)
+    return bytes(head + body)
+
+
+def decode_snapshot(
+    data: bytes,
+) -> Tuple[Dict[Entity, None], Dict[Type[Component], Dict[Entity, Component]]]:
+    """Decodes a snapshot into entities and component stores."""
+    if data[:4] != _SNAPSHOT_MAGIC:
+        raise ValueError("Not an ems snapshot")
+    pos = 4
+
+    count, pos = _read_uint(data, pos)
+    strings = []
+    for _ in range(count):
+        size, pos = _read_uint(data, pos)
+        strings.append(data[pos : pos + size].decode())
+        pos += size
+
+    def read_value() -> Any:
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag == _FLOAT:
+            value = _DOUBLE.unpack_from(data, pos)[0]
+            pos += 8
+            return value
+        if tag == _STR:
+            index, pos = _read_uint(data, pos)
+            return strings[index]
+        if tag == _INT:
+            raw, pos = _read_uint(data, pos)
+            return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1)
+        if tag == _NONE:
+            return None
+        if tag == _FALSE:
+            return False
+        if tag == _TRUE:
+            return True
+        if tag in (_TUPLE, _LIST, _SET):
+            size, pos = _read_uint(data, pos)
+            items = [read_value() for _ in range(size)]
+            if tag == _TUPLE:
+                return tuple(items)
+            return set(items) if tag == _SET else items
+        if tag == _DICT:
+            size, pos = _read_uint(data, pos)
+            result = {}
+            for _ in range(size):
+                key = read_value()
+                result[key] = read_value()
+            return result
+        if tag == _ENTITY:
+            uid, pos = _read_uint(data, pos)
+            return Entity(uid)
+        if tag == _RANDOM:
+            version, pos = _read_uint(data, pos)
+            state = _RANDOM_STATE.unpack_from(data, pos)
+            pos += _RANDOM_STATE.size
+            rng = random.Random()
+            rng.setstate((version, state, read_value()))
+            return rng
+        raise ValueError(f"Unknown snapshot tag {tag}")
+
+    def read_column(count: int) -> Iterable[Any]:
+        nonlocal pos
+        layout = data[pos]
+        pos += 1
+        if layout == _COLUMN_FLOAT:
+            column = struct.unpack_from(f"<{count}d", data, pos)
+            pos += 8 * count
+            return column
+        if layout == _COLUMN_INT:
+            column = struct.unpack_from(f"<{count}q", data, pos)
+            pos += 8 * count
+            return column
+        if layout == _COLUMN_NUMBER:
+            numbers = struct.unpack_from(f"<{count}d", data, pos)
+            pos += 8 * count
+            flags = data[pos : pos + count]
+            pos += count
+            return [
+                int(value) if is_int else value for value, is_int in zip(numbers, flags)
+            ]
+        if layout == _COLUMN_BOOL:
+            bools = [byte == 1 for byte in data[pos : pos + count]]
+            pos += count
+            return bools
+        if layout == _COLUMN_STR:
+            indices = struct.unpack_from(f"<{count}I", data, pos)
+            pos += 4 * count
+            return [strings[index] for index in indices]
+        return [read_value() for _ in range(count)]
+
+    count, pos = _read_uint(data, pos)
+    entity_list = [Entity(uid) for uid in struct.unpack_from(f"<{count}Q", data, pos)]
+    pos += 8 * count
+
+    components: Dict[Type[Component], Dict[Entity, Component]] = defaultdict(dict)
+    count, pos = _read_uint(data, pos)
+    for _ in range(count):
+        name_index, pos = _read_uint(data, pos)
+        component_type = Component.registry[strings[name_index]]
+        size, pos = _read_uint(data, pos)
+        fields = []
+        for _ in range(size):
+            field_index, pos = _read_uint(data, pos)
+            fields.append(strings[field_index])
+        members, pos = _read_uint(data, pos)
+        indices = struct.unpack_from(f"<{members}I", data, pos)
+        pos += 4 * members
+        columns = [read_column(members) for _ in fields]
+        store = components[component_type]
+        new = component_type.__new__
+        for index, row in zip(indices, zip(*columns)):
+            component = new(component_type)
+            component.__dict__.update(zip(fields, row))
+            store[entity_list[index]] = component
+
+    return dict.fromkeys(entity_list), components
+
+
+def diff_snapshots(a: bytes, b: bytes) -> List[str]:
+    """Describes how two snapshots differ, one line per difference."""
+    entities_a, components_a = decode_snapshot(a)
+    entities_b, components_b = decode_snapshot(b)
+    lines = []
+    for entity in entities_a.keys() - entities_b.keys():
+        lines.append(f"{entity!r} removed")
+    for entity in entities_b.keys() - entities_a.keys():
+        lines.append(f"{entity!r} added")
+
+    def describe(value: Any) -> Any:
+        return value.getstate() if isinstance(value, random.Random) else value
+
+    for component_type in components_a.keys() | components_b.keys():
+        name = component_type.__qualname__
+        store_a = components_a.get(component_type, {})
+        store_b = components_b.get(component_type, {})
+        for entity in store_a.keys() | store_b.keys():
+            if entity not in store_b:
+                lines.append(f"{entity!r}.{name} removed")
+            elif entity not in store_a:
+                lines.append(f"{entity!r}.{name} added")
+            else:
+                fields_a = vars(store_a[entity])
+                fields_b = vars(store_b[entity])
+                for field in fields_a.keys() | fields_b.keys():
+                    value_a = describe(fields_a.get(field))
+                    value_b = describe(fields_b.get(field))
+                    if value_a != value_b:
+                        lines.append(
+                            f"{entity!r}.{name}.{field}: {value_a!r} -> {value_b!r}"
+                        )
+    return sorted(lines)
+
+
+# endregion
+
+# region Input
+
+KEY_DOWN = "key_down"
+KEY_UP = "key_up"
+MOUSE_DOWN = "mouse_down"
+MOUSE_UP = "mouse_up"
+
+
+class InputEvent:
+    """A timestamped key or mouse event."""
+
+    __slots__ = ("kind", "code", "pos", "time")
+
+    def __init__(
+        self,
+        kind: str,
+        code: Any = None,
+        pos: Tuple[int, int] | None = None,
+        time: float = 0.0,
+    ):
+        self.kind = kind
+        self.code = code  # key or mouse button
+        self.pos = pos
+        self.time = time
+
+
+class InputQueue(Component):
+    """
+    Buffers input events between frames and maps keys and mouse buttons to
+    named actions. 'process' consumes the buffered events in one pass per
+    frame, so presses that start and end between two frames are not lost.
+    """
+
+    # Pending input belongs to the live session, not to the simulation state
+    transient = True
+
+    def __init__(self, bindings: Dict[str, Iterable[Any]] | None = None):
+        self.bindings = {
+            action: tuple(codes) for action, codes in (bindings or {}).items()
+        }
+        self._actions: Dict[Any, List[str]] = defaultdict(list)
+        for action, codes in self.bindings.items():
+            for code in codes:
+                self._actions[code].append(action)
+        self.pending: List[InputEvent] = []
+        self.events: List[InputEvent] = []
+        self.held: Set[Any] = set()
+        self.pressed: Set[str] = set()
+        self.released: Set[str] = set()
+
+    def push(self, kind: str, code: Any = None, pos: Tuple[int, int] | None = None):
+        """Buffers an event until the next 'process' call."""
+        self.pending.append(InputEvent(kind, code, pos, time.perf_counter()))
+
+    def process(self):
+        """Makes the buffered events the current frame's events."""
+        self.events = self.pending
+        self.pending = []
+        self.pressed.clear()
+        self.released.clear()
+        for event in self.events:
+            if event.kind in (KEY_DOWN, MOUSE_DOWN):
+                self.held.add(event.code)
+                self.pressed.update(self._actions.get(event.code, ()))
+            elif event.kind in (KEY_UP, MOUSE_UP):
+                self.held.discard(event.code)
+                self.released.update(self._actions.get(event.code, ()))
+
+    def is_down(self, action: str) -> bool:
+        """True while any input bound to 'action' is held."""
+        return any(code in self.held for code in self.bindings.get(action, ()))
+
+    def was_pressed(self, action: str) -> bool:
+        """True if 'action' was pressed during the current frame."""
+        return action in self.pressed
+
+    def was_released(self, action: str) -> bool:
+        """True if 'action' was released during the current frame."""
+        return action in self.released
+
+    def is_active(self, action: str) -> bool:
+        """True if 'action' is held or was tapped during the current frame."""
+        return action in self.pressed or self.is_down(action)
+
+    def events_for(self, action: str) -> List[InputEvent]:
+        """Returns the current frame's events bound to 'action'."""
+        codes = self.bindings.get(action, ())
+        return [event for event in self.events if event.code in codes]
+
+
+# endregion
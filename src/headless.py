@@ -0,0 +1,73 @@
+"""
+Loads the game without a window or audio device, so its simulation can be
+driven directly. For example, to replay a run recorded with WIBBLO_RECORD:
+
+    python src/headless.py replay records/run_20250101_120000_000.wbl
+"""
+
+import argparse
+import os
+import sys
+from types import ModuleType
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_game_module: ModuleType | None = None
+
+
+def load_game() -> ModuleType:
+    """Imports main.py as a Pygame Zero module without entering its loop."""
+    global _game_module
+
+    if _game_module is not None:
+        return _game_module
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ["WIBBLO_HEADLESS"] = "1"
+    # Keeps 'import pgzrun' in main.py from taking over this process
+    setattr(sys, "_pgzrun", True)
+
+    from pgzero.runner import prepare_mod
+
+    path = os.path.join(SRC_DIR, "main.py")
+    mod = ModuleType("main")
+    mod.__file__ = path
+    prepare_mod(mod)
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+    exec(code, mod.__dict__)
+
+    _game_module = mod
+    return mod
+
+
+def replay(path: str) -> bool:
+    """Replays an input log and reports whether the final state matches."""
+    game_module = load_game()
+    log = game_module.InputLog.load(path)
+    game = game_module.replay(log)
+    digest = game.state_digest()
+    print(f"ticks:  {len(log)}")
+    print(f"seed:   {log.seed}")
+    print(f"digest: {digest}")
+    if not log.digest:
+        return True
+    matches: bool = log.digest.decode() == digest
+    print("match:  " + ("yes" if matches else f"no (recorded {log.digest.decode()})"))
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Wibblo without a window.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="replay a recorded run")
+    replay_parser.add_argument("log", help="input log written by WIBBLO_RECORD")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        sys.exit(0 if replay(args.log) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Levels are written as JSON in src/levels and compiled to a binary .lvl file
+that the game loads with a single read. The game compiles a level itself
+when its .lvl is missing or older than the JSON; to compile them ahead of
+time, e.g. for a build:
+
+    python src/level.py src/levels/*.json
+
+A level source looks like this, with the tile grid drawn top to bottom, one
+character per tile and '.' for empty cells:
+
+    {
+      "chunk_columns": 4,
+      "spawn": [400, 336],
+      "enemies": {"y": 320, "speed": 140.0, "interval": 3.0, "ramp": 0.02},
+      "legend": {"G": "tile_green_05", "D": "tile_green_03"},
+      "tiles": ["....", "GGGG", "DDDD"]
+    }
+"""
+
+import argparse
+import json
+import os
+import struct
+from typing import Dict, List, Tuple
+
+MAGIC = b"WLVL"
+VERSION = 1
+# magic, version, columns, rows, chunk columns, spawn x and y, enemy y,
+# speed, spawn interval, difficulty ramp, texture count
+HEADER = struct.Struct("<4sHHHHddddddH")
+EMPTY = "."
+
+
+class Level:
+    """
+    A compiled level. Its tiles are a column-major grid of texture indices,
+    shifted by one so 0 means no tile; a chunk's tiles are one slice of it.
+    """
+
+    def __init__(
+        self,
+        columns: int,
+        rows: int,
+        chunk_columns: int,
+        spawn: Tuple[float, float],
+        enemy_y: float,
+        enemy_speed: float,
+        enemy_interval: float,
+        difficulty_ramp: float,
+        textures: List[str],
+        grid: bytes,
+    ):
+        self.columns = columns
+        self.rows = rows
+        self.chunk_columns = chunk_columns
+        self.spawn = spawn
+        self.enemy_y = enemy_y
+        self.enemy_speed = enemy_speed
+        self.enemy_interval = enemy_interval
+        self.difficulty_ramp = difficulty_ramp
+        self.textures = textures
+        self.grid = grid
+
+    @property
+    def chunks(self) -> int:
+        return -(-self.columns // self.chunk_columns)
+
+    def column(self, c: int) -> bytes:
+        """The tiles of a column, top to bottom."""
+        return self.grid[c * self.rows : (c + 1) * self.rows]
+
+
+def compile_level(source: Dict) -> bytes:
+    """Compiles a parsed level source into the binary format."""
+    rows: List[str] = source["tiles"]
+    columns = len(rows[0]) if rows else 0
+    if any(len(row) != columns for row in rows):
+        raise ValueError("All rows of 'tiles' must have the same length")
+
+    legend: Dict[str, str] = source["legend"]
+    for key, texture in legend.items():
+        if len(key) != 1 or key == EMPTY:
+            raise ValueError(
+                f"Legend key {key!r} must be one character other than {EMPTY!r}"
+            )
+        if len(texture.encode()) > 255:
+            raise ValueError(
+                f"Texture name of legend entry {key!r} is longer than 255 bytes"
+            )
+    textures = list(dict.fromkeys(legend.values()))
+    # Tiles are one byte each, and 0 means no tile
+    if len(textures) > 255:
+        key = next(k for k, texture in legend.items() if texture == textures[255])
+        raise ValueError(
+            f"Legend entry {key!r} is past the 255 distinct textures a level"
+            f" can have ({len(textures)} in all)"
+        )
+    indices = {key: textures.index(texture) + 1 for key, texture in legend.items()}
+    indices[EMPTY] = 0
+
+    grid = bytearray(columns * len(rows))
+    for r, row in enumerate(rows):
+        for c, key in enumerate(row):
+            if key not in indices:
+                raise ValueError(
+                    f"Tile {key!r} at row {r}, column {c} isn't in the legend"
+                )
+            grid[c * len(rows) + r] = indices[key]
+
+    enemies = source["enemies"]
+    data = bytearray(
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            columns,
+            len(rows),
+            source.get("chunk_columns", 4),
+            *source["spawn"],
+            enemies["y"],
+            enemies["speed"],
+            enemies["interval"],
+            enemies["ramp"],
+            len(textures),
+        )
+    )
+    for texture in textures:
+        encoded = texture.encode()
+        data.append(len(encoded))
+        data.extend(encoded)
+    data.extend(grid)
+    return bytes(data)
+
+
+def parse_level(data: bytes) -> Level:
+    """Decodes a compiled level."""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a compiled level")
+    (
+        _,
+        version,
+        columns,
+        rows,
+        chunk_columns,
+        spawn_x,
+        spawn_y,
+        enemy_y,
+        enemy_speed,
+        enemy_interval,
+        difficulty_ramp,
+        texture_count,
+    ) = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported level version {version}")
+
+    pos = HEADER.size
+    textures = []
+    for _ in range(texture_count):
+        size = data[pos]
+        textures.append(data[pos + 1 : pos + 1 + size].decode())
+        pos += 1 + size
+
+    return Level(
+        columns,
+        rows,
+        chunk_columns,
+        (spawn_x, spawn_y),
+        enemy_y,
+        enemy_speed,
+        enemy_interval,
+        difficulty_ramp,
+        textures,
+        data[pos : pos + columns * rows],
+    )
+
+
+def compile_file(source_path: str) -> str:
+    """Compiles a level source file to the .lvl next to it."""
+    with open(source_path) as f:
+        data = compile_level(json.load(f))
+    target_path = os.path.splitext(source_path)[0] + ".lvl"
+    with open(target_path, "wb") as f:
+        f.write(data)
+    return target_path
+
+
+def load_level(directory: str, name: str) -> Level:
+    """
+    Loads a level by name, compiling its source first if the compiled file is
+    missing or stale. When the compiled file can't be written, e.g. in a
+    read-only install, the level is compiled in memory.
+    """
+    source_path = os.path.join(directory, f"{name}.json")
+    compiled_path = os.path.join(directory, f"{name}.lvl")
+    if os.path.exists(source_path) and (
+        not os.path.exists(compiled_path)
+        or os.path.getmtime(source_path) > os.path.getmtime(compiled_path)
+    ):
+        try:
+            compile_file(source_path)
+        except OSError:
+            with open(source_path) as f:
+                return parse_level(compile_level(json.load(f)))
+
+    with open(compiled_path, "rb") as f:
+        return parse_level(f.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile Wibblo levels.")
+    parser.add_argument("sources", nargs="+", help="level sources (.json)")
+    args = parser.parse_args()
+
+    for source_path in args.sources:
+        print(f"{source_path} -> {compile_file(source_path)}")
+
+
+if __name__ == "__main__":
+    main()
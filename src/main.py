@@ -1,13 +1,54 @@
+import atexit
+import gc
+import hashlib
+import itertools
+import math
+import os
 import random
-from typing import List, Literal, Tuple
-
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal, Tuple
+
+import numpy as np
+import pgzero.loaders
 import pgzrun
 import pygame
 
-from ems import Component, System, World
+import level
+import savedata
+import startup
+from ems import (
+    KEY_DOWN,
+    KEY_UP,
+    MOUSE_DOWN,
+    MOUSE_UP,
+    AllocationProfiler,
+    Changed,
+    Component,
+    Entity,
+    Event,
+    InputQueue,
+    Scene,
+    SceneManager,
+    SpatialHash,
+    System,
+    World,
+    sweep_aabb,
+)
 
 # region Constants
 
+# When startup began: from the build's runtime hook or startup.py, which run
+# before any import, or from here when running main.py directly
+STARTED = getattr(sys, "_wibblo_started", time.perf_counter())
+
+# File to write a trace of the startup phases to, if set (see startup.py)
+STARTUP_TRACE = os.environ.get(startup.TRACE_ENV)
+_startup_trace = startup.StartupTrace(STARTUP_TRACE, STARTED)
+_startup_trace.mark("imports")
+
 # Window settings
 WIDTH = 800
 HEIGHT = 600
@@ -18,6 +59,7 @@ TILE_SIZE = 64
 CURSOR_SIZE = 32
 BUTTON_WIDTH = 192
 BUTTON_HEIGHT = 64
+UI_FONT = "kenney_future"
 
 PLAYER_WIDTH = 70
 PLAYER_HEIGHT = 94
@@ -27,18 +69,104 @@ GRAVITY = 1200.0
 JUMP_FORCE = -500.0
 MOVE_SPEED = 300.0
 
+# The level played, from levels/<name>.json (see level.py)
+LEVEL_NAME = os.environ.get("WIBBLO_LEVEL", "meadow")
+LEVEL = level.load_level(os.path.join(pgzero.loaders.root, "levels"), LEVEL_NAME)
+_startup_trace.mark("level")
+
 # Enemy constants
 ENEMY_WIDTH = 64
 ENEMY_HEIGHT = 64
-ENEMY_BASE_SPEED = 140.0
-ENEMY_SPAWN_INTERVAL = 3.0
-
-# Will be set in _create_map()
-GROUND_TOP_Y = 0
+ENEMY_BASE_SPEED = LEVEL.enemy_speed
+ENEMY_SPAWN_INTERVAL = LEVEL.enemy_interval
+
+# Speed multiplier gained per second survived
+DIFFICULTY_RAMP = LEVEL.difficulty_ramp
+
+# Continuous collision: how far a swept body may sink into what it hits, so
+# the collision resolution still sees the contact (e.g. to land on the ground)
+CCD_SKIN = 1.0
+BROADPHASE_CELL_SIZE = TILE_SIZE * 2
+
+# Seconds a body must rest before it falls asleep
+SLEEP_DELAY = 0.5
+
+# Level streaming: the level is a row of chunks of tile columns, built as the
+# camera approaches them and destroyed once it's far away
+CHUNK_COLUMNS = LEVEL.chunk_columns
+CHUNK_WIDTH = CHUNK_COLUMNS * TILE_SIZE
+LEVEL_CHUNKS = LEVEL.chunks
+LEVEL_WIDTH = LEVEL.columns * TILE_SIZE
+CHUNK_MARGIN = CHUNK_WIDTH  # loaded beyond each side of the camera
+
+# Set by headless.py when running without a window or audio device
+HEADLESS = os.environ.get("WIBBLO_HEADLESS") == "1"
+
+# Directory where each run's input is recorded, if set
+RECORD_DIR = os.environ.get("WIBBLO_RECORD")
+
+# Seconds per menu frame spent building the first run's Game
+GAME_BUILD_BUDGET = 0.004
+
+# Threads that update non-conflicting systems together, 0 to update serially.
+# Off by default: the costly systems, movement then collision resolution,
+# depend on each other, and the small ones that can share a stage hold the
+# GIL, so threads measured slower than updating serially.
+SYSTEM_THREADS = int(os.environ.get("WIBBLO_THREADS", "0"))
+
+# Settings, high scores and run statistics, kept in memory only when headless
+SAVE_PATH = (
+    None
+    if HEADLESS
+    else os.environ.get("WIBBLO_SAVE")
+    or os.path.join(savedata.user_data_dir("Wibblo"), "wibblo.sav")
+)
+_save_data = savedata.SaveData(SAVE_PATH)
+atexit.register(_save_data.close)
+
+# File to write the allocations of each system to at exit, if set
+ALLOC_TRACE = os.environ.get("WIBBLO_ALLOC_TRACE")
+_alloc_profiler = AllocationProfiler() if ALLOC_TRACE else None
+
+# Garbage collection: "manual" keeps the collector off during runs and
+# collects at safe points like game over, "auto" leaves Python's defaults
+GC_POLICY = os.environ.get("WIBBLO_GC", "manual")
+# Young objects that may pile up during a run before a quick collection
+GC_YOUNG_LIMIT = 50_000
 
 # Audio toggles
-MUSIC_ENABLED = True
-SFX_ENABLED = True
+MUSIC_ENABLED = not HEADLESS and _save_data.get("music_enabled", True)
+SFX_ENABLED = not HEADLESS and _save_data.get("sfx_enabled", True)
+
+# Music streaming
+MUSIC_DIR = "music"
+MUSIC_FADE_TIME = 0.5  # seconds to fade between tracks
+# Track of each kind of scene, and whether it resumes where it was left
+SCENE_MUSIC = {
+    "menu": ("music_space_cadet", True),
+    "game_over": ("music_game_over", False),
+    "game": ("music_sad_descent", True),
+    "pause": ("music_infinite_descent", True),
+}
+
+# Sound effects
+SFX_CHANNELS = 8
+
+# Input bindings (action -> keys or mouse buttons)
+ACTION_BINDINGS = {
+    "left": [keys.LEFT, keys.A],
+    "right": [keys.RIGHT, keys.D],
+    "jump": [keys.SPACE, keys.W],
+    "click": [mouse.LEFT],
+    "perf_hud": [keys.F3],
+    "pause": [keys.ESCAPE, keys.P],
+}
+
+# Performance overlay
+PERF_HUD_FRAMES = 120  # frames in the frame time graph
+PERF_HUD_REFRESH = 0.25  # seconds between redraws of the overlay
+PERF_HUD_ARCHETYPES = 5  # most common archetypes listed
+PERF_HUD_WIDTH = 2 * PERF_HUD_FRAMES + 12
 
 # endregion
 
@@ -64,7 +192,7 @@ class Gravity(Component):
         self.g = g
 
 
-class Sprite(Component):
+class Sprite(Component, tracked=("texture", "width", "height", "offset")):
     def __init__(
         self,
         texture: str,
@@ -84,7 +212,7 @@ class Sprite(Component):
         self.mirror_offset_on_flip = mirror_offset_on_flip
 
 
-class Animation(Component):
+class Animation(Component, tracked=("frames", "frame_index")):
     def __init__(
         self,
         frames: List[str],
@@ -115,6 +243,7 @@ class Player(Component):
         self.walking = False
         self.was_on_ground = True
         self.landed = False
+        self.kills = 0
 
 
 class Lives(Component):
@@ -136,15 +265,13 @@ class CollisionTarget(Component):
     def __init__(self, width: float, height: float):
         self.width = width
         self.height = height
-        self.colliding = False
 
 
 class Impactor(Component):
-    def __init__(self):
-        self.colliding = False
-        self.colliding_with_enemy = False
-        self.colliding_with_enemy_side = False
-        self.colliding_with_enemy_top = False
+    def __init__(self, ccd: bool = False):
+        # Sweep the move against solid targets so fast bodies can't pass
+        # through them
+        self.ccd = ccd
 
 
 class Controls(Component):
@@ -152,6 +279,8 @@ class Controls(Component):
         self.left = False
         self.right = False
         self.jump = False
+        # When set, ControlsSystem leaves the values to a replay or a script
+        self.scripted = False
 
 
 class Footsteps(Component):
@@ -159,6 +288,7 @@ class Footsteps(Component):
         self,
         sound_names: List[str],
         sps: int = 6,  # sound per second
+        rng: random.Random | None = None,
     ):
         self.sound_names = sound_names
         self.sps = sps
@@ -167,18 +297,26 @@ class Footsteps(Component):
         self.last_index = -1
         self.was_walking = False
         # Dedicated RNG to avoid interference from global seeding elsewhere
-        self.rng = random.Random()
-
-
-class Cursor(Component):
-    def __init__(self, cursor_type: Literal["default", "pointer"] = "default"):
-        self.cursor_type = cursor_type
+        self.rng = rng or random.Random()
 
 
 class Difficulty(Component):
-    def __init__(self):
+    def __init__(self, ramp: float = DIFFICULTY_RAMP):
         self.elapsed = 0.0
         self.speed_multiplier = 1.0
+        self.ramp = ramp
+
+
+class EnemySpawner(Component):
+    def __init__(
+        self,
+        rng: random.Random | None = None,
+        interval: float = ENEMY_SPAWN_INTERVAL,
+    ):
+        self.timer = 0.0
+        self.rng = rng or random.Random()
+        self.interval = interval
+        self.spawned = 0
 
 
 class DeathTimer(Component):
@@ -190,15 +328,530 @@ class Dead(Component):
     pass
 
 
+class Static(Component):
+    """Never moves, like the tiles. Physics skips it except as a target."""
+
+
+class Kinematic(Component):
+    """
+    Moved by its velocity and gravity, with no collision response, like a
+    dead enemy falling off-screen.
+    """
+
+
+class Sleeper(Component):
+    """Lets a dynamic body fall asleep after resting for a while."""
+
+    def __init__(self, delay: float = SLEEP_DELAY):
+        self.delay = delay
+        self.rest_time = 0.0
+
+
+class Sleeping(Component):
+    """A resting body that physics skips until its velocity changes."""
+
+
+class Camera(Component):
+    """The part of the level shown on screen, following its target."""
+
+    def __init__(self, target=None, width: int = WIDTH, height: int = HEIGHT):
+        self.target = target
+        self.x = 0.0
+        self.y = 0.0
+        self.width = width
+        self.height = height
+
+
+class Parallax(Component):
+    """
+    Drawn in screen space, scrolling at a fraction of the camera's speed and
+    repeating every 'wrap' pixels.
+    """
+
+    def __init__(self, factor: float, wrap: float):
+        self.factor = factor
+        self.wrap = wrap
+
+
+class Chunk(Component):
+    """Tags the tiles of a level chunk, destroyed when it's streamed out."""
+
+    def __init__(self, index: int):
+        self.index = index
+
+
+class LevelStreamer(Component):
+    def __init__(self):
+        # Chunks whose tiles exist, in the order they were built
+        self.active: List[int] = []
+        # Enemies of the chunks streamed out, as (x, y, base_speed) by chunk
+        self.dormant: Dict[int, List[Tuple[float, float, float]]] = {}
+
+
+# endregion
+
+# region Events
+
+
+class GameOver(Event):
+    """The player ran out of lives. Published every update until handled."""
+
+    __slots__ = ("player",)
+
+    def __init__(self, player: Entity):
+        self.player = player
+
+
+class ButtonPressed(Event):
+    """A UI button was clicked, i.e. pressed and released over it."""
+
+    __slots__ = ("action",)
+
+    def __init__(self, action: str):
+        self.action = action
+
+
+# endregion
+
+# region Resources
+
+
+class Contact:
+    """
+    An impactor 'a' overlapping a target 'b', found by the collision detection.
+    The normal points from b to a along the axis of least penetration, and
+    the kind tells where a touches b: on its "top", "bottom" or "side".
+    Grazing contacts are too shallow to count as a hit.
+    """
+
+    __slots__ = ("a", "b", "normal", "penetration", "kind", "grazing")
+
+    def __init__(
+        self,
+        a,
+        b,
+        normal: Tuple[int, int],
+        penetration: float,
+        kind: Literal["top", "bottom", "side"],
+        grazing: bool,
+    ):
+        self.a = a
+        self.b = b
+        self.normal = normal
+        self.penetration = penetration
+        self.kind = kind
+        self.grazing = grazing
+
+
+class Contacts:
+    """
+    The contacts of the current frame, rebuilt by the collision detection. A
+    resource of the game's world.
+    """
+
+    def __init__(self):
+        self.contacts: List[Contact] = []
+
+
+class Cursor:
+    """The mouse cursor drawn over every scene, and the look it has."""
+
+    def __init__(self, cursor_type: Literal["default", "pointer"] = "default"):
+        self.cursor_type = cursor_type
+
+
+class Textures:
+    """
+    The textures of every scene by name, with their mirrored and scaled
+    variants made once, the first time they're asked for.
+    """
+
+    def __init__(self):
+        self.flipped: Dict[str, pygame.Surface] = {}
+        self.scaled: Dict[Tuple[str, int, int], pygame.Surface] = {}
+
+    def get(self, name: str) -> pygame.Surface | None:
+        return getattr(images, name, None)
+
+    def get_flipped(self, name: str) -> pygame.Surface | None:
+        """The texture mirrored horizontally."""
+        texture = self.flipped.get(name)
+        if texture is None:
+            texture = self.get(name)
+            if texture is None:
+                return None
+            texture = pygame.transform.flip(texture, True, False)
+            self.flipped[name] = texture
+        return texture
+
+    def get_scaled(self, name: str, width: int, height: int) -> pygame.Surface | None:
+        """The texture smoothly scaled to 'width' by 'height'."""
+        key = (name, width, height)
+        texture = self.scaled.get(key)
+        if texture is None:
+            texture = self.get(name)
+            if texture is None:
+                return None
+            try:
+                texture = pygame.transform.smoothscale(texture, (width, height))
+            except (pygame.error, ValueError):
+                pass
+            self.scaled[key] = texture
+        return texture
+
+
+class Fonts:
+    """
+    The fonts of every scene by name and size, loaded once, and the text
+    drawn with them, rendered once. The name None is pygame's default font.
+    """
+
+    def __init__(self):
+        self.fonts: Dict[Tuple[str | None, int], pygame.font.Font] = {}
+        self.texts: Dict[
+            Tuple[str, str | None, int, Tuple[int, int, int]], pygame.Surface
+        ] = {}
+
+    def get(self, name: str | None, size: int) -> pygame.font.Font:
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            if name is None:
+                font = pygame.font.Font(None, size)
+            else:
+                font = pgzero.loaders.fonts.load(name, size)
+            self.fonts[key] = font
+        return font
+
+    def render(
+        self,
+        text: str,
+        size: int,
+        color: Tuple[int, int, int],
+        name: str | None = UI_FONT,
+    ) -> pygame.Surface:
+        """
+        The text drawn in a font. Only for text that takes few values, like
+        labels, since every one is kept.
+        """
+        key = (text, name, size, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.get(name, size).render(text, True, color)
+            self.texts[key] = surface
+        return surface
+
+
+class SoundSpec:
+    """Playback rules shared by every sound of a group."""
+
+    def __init__(self, priority: int = 0, cooldown: float = 0.0, max_voices: int = 2):
+        self.priority = priority
+        self.cooldown = cooldown  # minimum seconds between two plays
+        self.max_voices = max_voices  # simultaneous channels for the group
+
+
+SFX_SPECS = {
+    "click5": SoundSpec(priority=10, cooldown=0.05, max_voices=1),
+    "footstep": SoundSpec(priority=1, cooldown=0.08, max_voices=2),
+}
+
+
+class AudioManager:
+    """
+    Owns a fixed pool of mixer channels for sound effects. Sounds requested
+    during a frame are queued and flushed once by the AudioSystem, which
+    applies each group's cooldown and voice limit, and steals the lowest
+    priority voice when the pool is full. Music streams separately through
+    pygame.mixer.music, so it never competes for these channels.
+    """
+
+    def __init__(self, channels: int = SFX_CHANNELS, specs=SFX_SPECS):
+        self.channel_count = channels
+        self.specs: Dict[str, SoundSpec] = specs
+        self.default_spec = SoundSpec()
+        self.queue: List[Tuple[str, str]] = []
+        self.time = 0.0
+        self._channels: List[pygame.mixer.Channel] | None = None
+        self._voices: List[Tuple[str, int] | None] = []
+        self._last_played: Dict[str, float] = {}
+
+    def play(self, name: str, group: str | None = None):
+        """Queues the sound 'name'; 'group' shares limits between variants."""
+        if not SFX_ENABLED:
+            return
+        self.queue.append((name, group or name))
+
+    def flush(self, dt: float):
+        """Plays the sounds queued since the last flush."""
+        self.time += dt
+        if not self.queue:
+            return
+        requests = self.queue
+        self.queue = []
+        channels = self._get_channels()
+        if not channels:
+            return
+
+        # At most one voice per group and frame, most important first
+        seen = set()
+        pending = []
+        for name, group in requests:
+            if group in seen:
+                continue
+            seen.add(group)
+            pending.append((self.specs.get(group, self.default_spec), name, group))
+        pending.sort(key=lambda item: -item[0].priority)
+
+        for spec, name, group in pending:
+            last = self._last_played.get(group)
+            if last is not None and self.time - last < spec.cooldown:
+                continue
+            sound = getattr(sounds, name, None)
+            if not sound:
+                continue
+            index = self._pick_channel(channels, spec, group)
+            if index is None:
+                continue
+            channels[index].play(sound)
+            self._voices[index] = (group, spec.priority)
+            self._last_played[group] = self.time
+
+    def _pick_channel(self, channels, spec: SoundSpec, group: str) -> int | None:
+        free = None
+        victim = None
+        victim_priority = spec.priority
+        voices = 0
+        for i, channel in enumerate(channels):
+            voice = self._voices[i]
+            if not channel.get_busy() or voice is None:
+                self._voices[i] = None
+                if free is None:
+                    free = i
+                continue
+            if voice[0] == group:
+                voices += 1
+            if voice[1] < victim_priority:
+                victim = i
+                victim_priority = voice[1]
+        if voices >= spec.max_voices:
+            return None
+        if free is not None:
+            return free
+        if victim is not None:
+            channels[victim].stop()
+        return victim
+
+    def _get_channels(self) -> List[pygame.mixer.Channel]:
+        if self._channels is None:
+            try:
+                pygame.mixer.set_num_channels(self.channel_count)
+                self._channels = [
+                    pygame.mixer.Channel(i) for i in range(self.channel_count)
+                ]
+            except pygame.error:
+                self._channels = []
+            self._voices = [None] * len(self._channels)
+        return self._channels
+
+
+# The stack of scenes and the resources they share
+_scenes = SceneManager()
+_scenes.resources.insert(Textures())
+_scenes.resources.insert(Fonts())
+_scenes.resources.insert(Cursor())
+_audio = AudioManager()
+_scenes.resources.insert(_audio)
+
 # endregion
 
 
+# region Level
+
+
+def _get_camera(world: World) -> Camera | None:
+    return world.get_single_component(Camera)
+
+
+def _center_camera(world: World, camera: Camera):
+    """Centers the camera on its target, without showing past the level."""
+    pos = world.get_component(camera.target, Position) if camera.target else None
+    if pos is None:
+        return
+    col = world.get_component(camera.target, CollisionTarget)
+    center = pos.x + (col.width / 2 if col else 0)
+    camera.x = min(max(center - camera.width / 2, 0), LEVEL_WIDTH - camera.width)
+
+
+def _create_blinky(world: World, x: float, y: float, speed: float = ENEMY_BASE_SPEED):
+    e = world.create_entity()
+    world.add_component(e, Enemy(speed))
+    world.add_component(e, Blinky())
+    world.add_component(e, Position(x, y))
+    world.add_component(e, Velocity(0, 0))
+    world.add_component(e, Gravity(GRAVITY))
+    world.add_component(e, Impactor(ccd=True))
+    world.add_component(e, CollisionTarget(ENEMY_WIDTH, ENEMY_HEIGHT))
+    world.add_component(e, FlipX())
+    world.add_component(
+        e,
+        Sprite(
+            "blinky_walk01",
+            ENEMY_WIDTH,
+            ENEMY_HEIGHT,
+            anchor=("left", "top"),
+            offset=(0, 0),
+            layer=900,
+            mirror_offset_on_flip=False,
+        ),
+    )
+    world.add_component(
+        e,
+        WalkingAnimation(
+            [
+                "blinky_walk01",
+                "blinky_walk02",
+                "blinky_walk03",
+            ],
+            fps=10,
+            # Optionally pass explicit frame sizes here if desired
+            # frame_sizes=[(32, 44), (32, 42), (49, 38)],
+        ),
+    )
+    return e
+
+
+def _chunk_range(left: float, right: float) -> range:
+    """The chunks overlapping the span between the two x coordinates."""
+    first = max(int(left // CHUNK_WIDTH), 0)
+    return range(first, min(int(right // CHUNK_WIDTH) + 1, LEVEL_CHUNKS))
+
+
+def _activate_chunk(world: World, streamer: LevelStreamer, index: int):
+    """Spawns the tiles of a chunk of the level in one batch."""
+    positions = []
+    targets = []
+    sprites = []
+    first = index * CHUNK_COLUMNS
+    for c in range(first, min(first + CHUNK_COLUMNS, LEVEL.columns)):
+        x = c * TILE_SIZE
+        for r, tile in enumerate(LEVEL.column(c)):
+            if not tile:
+                continue
+            positions.append(Position(x, r * TILE_SIZE))
+            targets.append(CollisionTarget(TILE_SIZE, TILE_SIZE))
+            sprites.append(Sprite(LEVEL.textures[tile - 1], TILE_SIZE, TILE_SIZE))
+    count = len(positions)
+    # One Static and Chunk per tile, since each component has its own ticks
+    statics = [Static() for _ in range(count)]
+    chunks = [Chunk(index) for _ in range(count)]
+    world.create_entities(count, [positions, targets, statics, chunks, sprites])
+
+    # Wake the enemies left behind when the chunk was streamed out
+    for x, y, speed in streamer.dormant.pop(index, []):
+        _create_blinky(world, x, y, speed)
+    streamer.active.append(index)
+
+
+def _deactivate_chunk(world: World, streamer: LevelStreamer, index: int):
+    """Destroys the tiles of a chunk and puts its enemies to rest."""
+    for tile in world.get_matching_entities({Chunk}):
+        if world.get_component(tile, Chunk).index == index:
+            world.destroy_entity(tile)
+
+    left = index * CHUNK_WIDTH
+    right = left + CHUNK_WIDTH
+    dormant = []
+    for enemy in world.get_matching_entities({Enemy, Position}):
+        pos = world.get_component(enemy, Position)
+        if left <= pos.x < right:
+            speed = world.get_component(enemy, Enemy).base_speed
+            dormant.append((pos.x, pos.y, speed))
+            world.destroy_entity(enemy)
+    # Dead enemies are only falling off-screen, let them go
+    for body in world.get_matching_entities({Dead, Position}):
+        if left <= world.get_component(body, Position).x < right:
+            world.destroy_entity(body)
+    if dormant:
+        streamer.dormant.setdefault(index, []).extend(dormant)
+    streamer.active.remove(index)
+
+
+def _stream_chunks(world: World):
+    """
+    Builds the chunks near the camera and streams out the ones far from it.
+    Chunks are kept a bit further than they're built, so walking back and
+    forth at the edge doesn't rebuild them every frame.
+    """
+    camera = _get_camera(world)
+    streamer = world.get_single_component(LevelStreamer)
+    if camera is None or streamer is None:
+        return
+
+    right = camera.x + camera.width
+    keep = _chunk_range(camera.x - 2 * CHUNK_MARGIN, right + 2 * CHUNK_MARGIN)
+    for index in [i for i in streamer.active if i not in keep]:
+        _deactivate_chunk(world, streamer, index)
+    for index in _chunk_range(camera.x - CHUNK_MARGIN, right + CHUNK_MARGIN):
+        if index not in streamer.active:
+            _activate_chunk(world, streamer, index)
+
+
+# endregion
+
 # region Systems
 
 
+class InputSystem(System):
+    reads = set()
+    writes = {InputQueue}
+
+    def update(self, dt: float):
+        # Consume the events buffered since the last frame in one pass
+        for entity in self.world.get_matching_entities({InputQueue}):
+            self.world.get_component(entity, InputQueue).process()
+
+
+def _get_contacts(world: World) -> Contacts | None:
+    return world.resources.get(Contacts)
+
+
+class SleepSystem(System):
+    reads = {Velocity, Kinematic}
+    writes = {Sleeper, Sleeping}
+
+    def update(self, dt: float):
+        # Kinematic bodies never come to rest on anything
+        for entity in self.world.get_matching_entities(
+            {Sleeper, Velocity}, exclude={Kinematic}
+        ):
+            sleeper = self.world.get_component(entity, Sleeper)
+            velocity = self.world.get_component(entity, Velocity)
+            resting = velocity.vx == 0 and velocity.vy == 0
+
+            if self.world.get_component(entity, Sleeping):
+                # Wake up once something sets the body in motion
+                if not resting:
+                    self.world.remove_component(entity, Sleeping)
+                    sleeper.rest_time = 0.0
+                continue
+
+            if not resting:
+                sleeper.rest_time = 0.0
+                continue
+            sleeper.rest_time += dt
+            if sleeper.rest_time >= sleeper.delay:
+                self.world.add_component(entity, Sleeping())
+
+
 class GravitySystem(System):
+    reads = {Gravity, Static, Sleeping}
+    writes = {Velocity}
+
     def update(self, dt: float):
-        affected_entities = self.world.get_matching_entities({Velocity, Gravity})
+        affected_entities = self.world.get_matching_entities(
+            {Velocity, Gravity}, exclude={Static, Sleeping}
+        )
 
         for entity in affected_entities:
             velocity = self.world.get_component(entity, Velocity)
@@ -210,9 +863,51 @@ class GravitySystem(System):
             velocity.vy += gravity.g * dt
 
 
+class StaticIndex:
+    """
+    Broadphase of the static entities, rebuilt when they come or go. Their
+    boxes come from the width and height of a shape component, the collision
+    target by default. Static entities get their position and shape together
+    with their Static component and keep them, so only Static membership is
+    watched: dynamic entities spawning or dying don't rebuild the index.
+    """
+
+    def __init__(self, world: World, shape_type: type = CollisionTarget):
+        self.world = world
+        self.shape_type = shape_type
+        self.hash = SpatialHash(BROADPHASE_CELL_SIZE)
+        self.version = None
+
+    def query(self, x: float, y: float, width: float, height: float):
+        version = self.world.versions[Static]
+        if version != self.version:
+            self.version = version
+            self.hash.clear()
+            for entity in self.world.get_matching_entities(
+                {Static, Position, self.shape_type}
+            ):
+                pos = self.world.get_component(entity, Position)
+                shape = self.world.get_component(entity, self.shape_type)
+                self.hash.insert(entity, pos.x, pos.y, shape.width, shape.height)
+        return self.hash.query(x, y, width, height)
+
+
 class MovementSystem(System):
+    reads = {Velocity, Impactor, CollisionTarget, Static, Kinematic, Sleeping}
+    writes = {Position}
+
+    def __init__(self, world):
+        super().__init__(world)
+        self.solids = StaticIndex(world)
+
     def update(self, dt: float):
-        movable_entities = self.world.get_matching_entities({Position, Velocity})
+        movable_entities = self.world.get_matching_entities(
+            {Position, Velocity}, exclude={Static, Sleeping}
+        )
+        # Moving solids, like enemies, that swept bodies mustn't pass through
+        dynamic = self.world.get_matching_entities(
+            {Position, CollisionTarget}, exclude={Static, Kinematic}
+        )
 
         for entity in movable_entities:
             position = self.world.get_component(entity, Position)
@@ -221,18 +916,125 @@ class MovementSystem(System):
             if not (position and velocity):
                 continue
 
-            position.x += velocity.vx * dt
-            position.y += velocity.vy * dt
+            dx = velocity.vx * dt
+            dy = velocity.vy * dt
+
+            impactor = self.world.get_component(entity, Impactor)
+            col = self.world.get_component(entity, CollisionTarget)
+            kinematic = self.world.get_component(entity, Kinematic)
+            if impactor and impactor.ccd and col and not kinematic and (dx or dy):
+                dx, dy = self._sweep(entity, position, col, dx, dy, dynamic)
+
+            position.x += dx
+            position.y += dy
+
+    def _sweep(
+        self,
+        entity: Entity,
+        pos: Position,
+        col: CollisionTarget,
+        dx: float,
+        dy: float,
+        dynamic: List[Entity],
+    ) -> Tuple[float, float]:
+        """Shortens a move that would pass through a solid target."""
+        x = min(pos.x, pos.x + dx)
+        y = min(pos.y, pos.y + dy)
+        width = col.width + abs(dx)
+        height = col.height + abs(dy)
+        candidates = self.solids.query(x, y, width, height)
+        for target in dynamic:
+            tpos = self.world.get_component(target, Position)
+            tcol = self.world.get_component(target, CollisionTarget)
+            if (
+                target != entity
+                and tpos.x < x + width
+                and tpos.x + tcol.width > x
+                and tpos.y < y + height
+                and tpos.y + tcol.height > y
+            ):
+                candidates.append(target)
+
+        toi, axis = self._time_of_impact(pos.x, pos.y, col, dx, dy, candidates)
+        if axis is None:
+            return dx, dy
+        # Slide the rest of the way along the other axis from the contact,
+        # which may run into another target, like a tile past a corner
+        x_at, y_at = dx * toi, dy * toi
+        if axis == "x":
+            slide_toi, slide_axis = self._time_of_impact(
+                pos.x + x_at, pos.y + y_at, col, 0, dy - y_at, candidates
+            )
+            y_at += (dy - y_at) * slide_toi
+            x_at += math.copysign(min(abs(dx) * (1 - toi), CCD_SKIN), dx)
+            if slide_axis is not None:
+                y_at += math.copysign(min(abs(dy - y_at), CCD_SKIN), dy)
+        else:
+            slide_toi, slide_axis = self._time_of_impact(
+                pos.x + x_at, pos.y + y_at, col, dx - x_at, 0, candidates
+            )
+            x_at += (dx - x_at) * slide_toi
+            y_at += math.copysign(min(abs(dy) * (1 - toi), CCD_SKIN), dy)
+            if slide_axis is not None:
+                x_at += math.copysign(min(abs(dx - x_at), CCD_SKIN), dx)
+        # Each stop is sunk by the skin, so resolution sees the contact
+        return x_at, y_at
+
+    def _time_of_impact(
+        self,
+        x: float,
+        y: float,
+        col: CollisionTarget,
+        dx: float,
+        dy: float,
+        candidates: List[Entity],
+    ) -> Tuple[float, str | None]:
+        """The first of the candidates a box moved by (dx, dy) hits."""
+        toi = 1.0
+        axis = None
+        for target in candidates:
+            tpos = self.world.get_component(target, Position)
+            tcol = self.world.get_component(target, CollisionTarget)
+            hit_toi, hit_axis = sweep_aabb(
+                x,
+                y,
+                col.width,
+                col.height,
+                dx,
+                dy,
+                tpos.x,
+                tpos.y,
+                tcol.width,
+                tcol.height,
+            )
+            if hit_axis is not None and hit_toi < toi:
+                toi = hit_toi
+                axis = hit_axis
+        return toi, axis
 
 
 class CollisionResolutionSystem(System):
+    reads = {Impactor, CollisionTarget, Enemy, Static, Kinematic, Sleeping}
+    writes = {Position, Velocity, Player}
+    resource_reads = {Contacts}
+
+    def __init__(self, world):
+        super().__init__(world)
+        self.statics = StaticIndex(world)
+
     def update(self, dt: float):
         # Entities that can move and collide
         impactors = self.world.get_matching_entities(
-            {Impactor, Position, CollisionTarget, Velocity}
+            {Impactor, Position, CollisionTarget, Velocity},
+            exclude={Static, Kinematic, Sleeping},
+        )
+        # Moving collision targets (possibly the player); the static ones
+        # (ground tiles) come from the broadphase
+        moving_targets = self.world.get_matching_entities(
+            {Position, CollisionTarget}, exclude={Static, Kinematic}
         )
-        # All collision targets (including ground tiles and possibly the player)
-        targets = self.world.get_matching_entities({Position, CollisionTarget})
+        contacts = _get_contacts(self.world)
+        touching = {c.a for c in contacts.contacts} if contacts else set()
 
         for entity in impactors:
             pos = self.world.get_component(entity, Position)
@@ -251,8 +1053,8 @@ class CollisionResolutionSystem(System):
             if pos.x < 0:
                 pos.x = 0
                 vel.vx = 0
-            elif pos.x + col.width > WIDTH:
-                pos.x = WIDTH - col.width
+            elif pos.x + col.width > LEVEL_WIDTH:
+                pos.x = LEVEL_WIDTH - col.width
                 vel.vx = 0
 
             # World boundary collisions (top/bottom)
@@ -264,8 +1066,8 @@ class CollisionResolutionSystem(System):
                 vel.vy = 0
                 on_ground = True
 
-            # Only resolve against targets if flagged colliding
-            if not imp_comp.colliding:
+            # Only resolve against targets if it touched any
+            if entity not in touching:
                 if player is not None:
                     try:
                         if (not player.was_on_ground) and on_ground:
@@ -278,7 +1080,8 @@ class CollisionResolutionSystem(System):
                 continue
 
             # Collide with other targets (tiles, etc.)
-            for target in targets:
+            targets = self.statics.query(pos.x, pos.y, col.width, col.height)
+            for target in targets + moving_targets:
                 if target is entity:
                     continue
 
@@ -351,74 +1154,48 @@ class CollisionResolutionSystem(System):
 
 class CombatSystem(System):
     def update(self, dt: float):
-        # Handle player-enemy combat based on flags (no physical resolution)
-        players = self.world.get_matching_entities(
-            {Player, Impactor, Position, Velocity, CollisionTarget}
-        )
-        if not players:
-            return
-        p = players[0]
-        ppos = self.world.get_component(p, Position)
-        pvel = self.world.get_component(p, Velocity)
-        pcol = self.world.get_component(p, CollisionTarget)
-        pimp = self.world.get_component(p, Impactor)
-        if not (ppos and pvel and pcol and pimp):
+        # Handle player-enemy combat based on contacts (no physical resolution)
+        contacts = _get_contacts(self.world)
+        if contacts is None:
             return
 
         # Stomp kill: player damaging enemy from top only when falling with overlap depth
-        if pimp.colliding_with_enemy_top and pvel.vy > 0:
-            enemies = self.world.get_matching_entities(
-                {Enemy, Position, CollisionTarget}
-            )
-            for e in enemies:
-                epos = self.world.get_component(e, Position)
-                ecol = self.world.get_component(e, CollisionTarget)
-                if not (epos and ecol):
-                    continue
-                ax1, ay1 = ppos.x, ppos.y
-                ax2, ay2 = ppos.x + pcol.width, ppos.y + pcol.height
-                bx1, by1 = epos.x, epos.y
-                bx2, by2 = epos.x + ecol.width, epos.y + ecol.height
-                if ax1 < bx2 and ax2 > bx1 and ay1 < by2 and ay2 > by1:
-                    # Ensure sufficient vertical overlap to count as stomp
-                    overlap_y = min(ay2, by2) - max(ay1, by1)
-                    min_overlap = min(pcol.height, ecol.height) * 0.1
-                    if overlap_y <= min_overlap:
-                        continue
-                    # Bounce player
-                    pvel.vy = JUMP_FORCE * 0.5
-                    # Kill enemy and let it fall off-screen
-                    tsprite = self.world.get_component(e, Sprite)
-                    if tsprite:
-                        tsprite.texture = "blinky_dead"
-                    self.world.remove_component(e, Enemy)
-                    self.world.remove_component(e, WalkingAnimation)
-                    self.world.remove_component(e, Impactor)
-                    self.world.remove_component(e, CollisionTarget)
-                    tvel = self.world.get_component(e, Velocity)
-                    if tvel:
-                        tvel.vx = 0
-                        tvel.vy = 0
-                    self.world.add_component(e, Dead())
-                    break
+        for contact in contacts.contacts:
+            if contact.kind != "top" or contact.grazing:
+                continue
+            p, e = contact.a, contact.b
+            player = self.world.get_component(p, Player)
+            pvel = self.world.get_component(p, Velocity)
+            if not (
+                player and self.world.get_component(e, Enemy) and pvel and pvel.vy > 0
+            ):
+                continue
+            # Bounce player
+            pvel.vy = JUMP_FORCE * 0.5
+            # Kill enemy and let it fall off-screen
+            tsprite = self.world.get_component(e, Sprite)
+            if tsprite:
+                tsprite.texture = "blinky_dead"
+            self.world.remove_component(e, Enemy)
+            self.world.remove_component(e, WalkingAnimation)
+            tvel = self.world.get_component(e, Velocity)
+            if tvel:
+                tvel.vx = 0
+                tvel.vy = 0
+            self.world.add_component(e, Dead())
+            # Out of collision, but still falling
+            self.world.add_component(e, Kinematic())
+            player.kills += 1
+            break
 
 
 class ControlsSystem(System):
+    reads = {InputQueue, CollisionTarget, WalkingAnimation}
+    writes = {Player, Position, Velocity, FlipX, Controls, Sprite}
+
     def update(self, dt: float):
-        player = self.world.get_matching_entities(
-            {
-                Player,
-                Position,
-                Velocity,
-                CollisionTarget,
-                FlipX,
-                WalkingAnimation,
-                Controls,
-                Sprite,
-            }
-        )[0]
-
-        if not player:
+        player = self.world.get_single(Player)
+        if player is None:
             return
 
         player_comp = self.world.get_component(player, Player)
@@ -430,9 +1207,12 @@ class ControlsSystem(System):
 
         # Update input state
 
-        controls.left = keyboard.left or keyboard.a
-        controls.right = keyboard.right or keyboard.d
-        controls.jump = keyboard.space or keyboard.w
+        queues = self.world.get_matching_entities({InputQueue})
+        if queues and not controls.scripted:
+            input_queue = self.world.get_component(queues[0], InputQueue)
+            controls.left = input_queue.is_active("left")
+            controls.right = input_queue.is_active("right")
+            controls.jump = input_queue.is_active("jump")
 
         # Handle movement
 
@@ -446,7 +1226,9 @@ class ControlsSystem(System):
             flip_comp.flip = False
 
         player_comp.walking = vel.vx != 0
-        player_comp.at_boundary = pos.x == 0 or pos.x + collision_target.width == WIDTH
+        player_comp.at_boundary = (
+            pos.x == 0 or pos.x + collision_target.width == LEVEL_WIDTH
+        )
 
         # Handle jump
 
@@ -468,6 +1250,9 @@ class ControlsSystem(System):
 
 
 class WalkingAnimationSystem(System):
+    reads = set()
+    writes = {WalkingAnimation}
+
     def update(self, dt: float):
         animated = self.world.get_matching_entities({WalkingAnimation})
 
@@ -485,6 +1270,10 @@ class WalkingAnimationSystem(System):
 
 
 class FootstepSystem(System):
+    reads = {Player, Velocity}
+    writes = {Footsteps}
+    resource_writes = {AudioManager}
+
     def update(self, dt: float):
         entities = self.world.get_matching_entities({Player, Velocity, Footsteps})
 
@@ -515,195 +1304,178 @@ class FootstepSystem(System):
 
 
 class DifficultySystem(System):
-    def update(self, dt: float):
-        entities = self.world.get_matching_entities({Difficulty})
+    reads = set()
+    writes = {Difficulty}
 
-        if not entities:
+    def update(self, dt: float):
+        d = self.world.get_single_component(Difficulty)
+        if d is None:
             return
 
-        difficulty = entities[0]
-        d = self.world.get_component(difficulty, Difficulty)
         d.elapsed += dt
         # Increase speed multiplier slowly over time
-        d.speed_multiplier = 1.0 + 0.02 * d.elapsed
+        d.speed_multiplier = 1.0 + d.ramp * d.elapsed
 
 
 class EnemySpawnSystem(System):
-    def __init__(self, world):
-        super().__init__(world)
-        self.timer = 0.0
-
     def update(self, dt: float):
-        self.timer += dt
-        if self.timer < ENEMY_SPAWN_INTERVAL:
-            return
-        self.timer = 0.0
+        for entity in self.world.get_matching_entities({EnemySpawner}):
+            spawner = self.world.get_component(entity, EnemySpawner)
+            spawner.timer += dt
+            if spawner.timer < spawner.interval:
+                continue
+            spawner.timer = 0.0
+            spawner.spawned += 1
 
-        self._spawn_blinky()
+            self._spawn_blinky(spawner.rng)
 
-    def _spawn_blinky(self):
-        # Spawn one Blinky from either left or right, just outside screen
-        side = -1 if random.random() < 0.5 else 1
+    def _spawn_blinky(self, rng: random.Random):
+        # Spawn one Blinky from either left or right, just outside the camera
+        camera = _get_camera(self.world)
+        left = camera.x if camera else 0
+        right = left + (camera.width if camera else WIDTH)
+        side = -1 if rng.random() < 0.5 else 1
         if side < 0:
-            x = -TILE_SIZE
+            x = left - TILE_SIZE
         else:
-            x = WIDTH + TILE_SIZE
-        y = max(GROUND_TOP_Y - ENEMY_HEIGHT, 0)
-
-        e = self.world.create_entity()
-        self.world.add_component(e, Enemy(ENEMY_BASE_SPEED))
-        self.world.add_component(e, Blinky())
-        self.world.add_component(e, Position(x, y))
-        self.world.add_component(e, Velocity(0, 0))
-        self.world.add_component(e, Gravity(GRAVITY))
-        self.world.add_component(e, Impactor())
-        self.world.add_component(e, CollisionTarget(ENEMY_WIDTH, ENEMY_HEIGHT))
-        self.world.add_component(e, FlipX())
-        self.world.add_component(
-            e,
-            Sprite(
-                "blinky_walk01",
-                ENEMY_WIDTH,
-                ENEMY_HEIGHT,
-                anchor=("left", "top"),
-                offset=(0, 0),
-                layer=900,
-                mirror_offset_on_flip=False,
-            ),
-        )
-        self.world.add_component(
-            e,
-            WalkingAnimation(
-                [
-                    "blinky_walk01",
-                    "blinky_walk02",
-                    "blinky_walk03",
-                ],
-                fps=10,
-                # Optionally pass explicit frame sizes here if desired
-                # frame_sizes=[(32, 44), (32, 42), (49, 38)],
-            ),
-        )
+            x = right + TILE_SIZE
+        _create_blinky(self.world, x, LEVEL.enemy_y)
 
 
 class EnemyAIChase(System):
+    reads = {Player, Position, CollisionTarget, Difficulty, Enemy}
+    writes = {Velocity, FlipX}
+
     def update(self, dt: float):
         # Find player position
-        players = self.world.get_matching_entities({Player, Position})
-        if not players:
-            return
-        player_entity = players[0]
+        player_entity = self.world.get_single(Player)
         player_pos = self.world.get_component(player_entity, Position)
+        if player_pos is None:
+            return
         player_col = self.world.get_component(player_entity, CollisionTarget)
 
         # Difficulty
         mult = 1.0
-        diff_ents = self.world.get_matching_entities({Difficulty})
-        if diff_ents:
-            diff = self.world.get_component(diff_ents[0], Difficulty)
+        diff = self.world.get_single_component(Difficulty)
+        if diff:
             mult = diff.speed_multiplier
 
         enemies = self.world.get_matching_entities({Enemy, Position, Velocity, FlipX})
-        for e in enemies:
-            pos = self.world.get_component(e, Position)
-            vel = self.world.get_component(e, Velocity)
-            enemy = self.world.get_component(e, Enemy)
-            flip = self.world.get_component(e, FlipX)
-            ecol = self.world.get_component(e, CollisionTarget)
-            if not (pos and vel and enemy):
-                continue
-            speed = enemy.base_speed * mult
-            if pos.x + ENEMY_WIDTH / 2 < player_pos.x:
-                vel.vx = speed
-                if flip:
-                    flip.flip = False
-            else:
-                vel.vx = -speed
-                if flip:
-                    flip.flip = True
-
-            # If overlapping the player, stand still (no pushing)
-            if ecol and player_col:
-                ax1, ay1 = pos.x, pos.y
-                ax2, ay2 = pos.x + ecol.width, pos.y + ecol.height
-                bx1, by1 = player_pos.x, player_pos.y
-                bx2, by2 = (
-                    player_pos.x + player_col.width,
-                    player_pos.y + player_col.height,
-                )
-                if ax1 < bx2 and ax2 > bx1 and ay1 < by2 and ay2 > by1:
-                    vel.vx = 0
+        if not enemies:
+            return
+        count = len(enemies)
+        components = self.world.components
+        positions = [components[Position][e] for e in enemies]
+        cols = [components[CollisionTarget].get(e) for e in enemies]
+
+        # Gather the enemies into arrays and steer them all at once
+        x = np.fromiter((pos.x for pos in positions), float, count)
+        speed = np.fromiter(
+            (components[Enemy][e].base_speed for e in enemies), float, count
+        )
+        speed *= mult
+        flip = x + ENEMY_WIDTH / 2 >= player_pos.x
+        vx = np.where(flip, -speed, speed)
+
+        # If overlapping the player, stand still (no pushing). Enemies without
+        # a collision box get NaN sizes, which never overlap.
+        if player_col:
+            y = np.fromiter((pos.y for pos in positions), float, count)
+            width = np.fromiter(
+                (col.width if col else np.nan for col in cols), float, count
+            )
+            height = np.fromiter(
+                (col.height if col else np.nan for col in cols), float, count
+            )
+            touching = (
+                (x < player_pos.x + player_col.width)
+                & (x + width > player_pos.x)
+                & (y < player_pos.y + player_col.height)
+                & (y + height > player_pos.y)
+            )
+            vx[touching] = 0
+
+        # Scatter the results back into the components
+        velocities = components[Velocity]
+        flips = components[FlipX]
+        for e, e_vx, e_flip in zip(enemies, vx.tolist(), flip.tolist()):
+            velocities[e].vx = e_vx
+            flips[e].flip = e_flip
 
 
 class CollisionDetectionSystem(System):
+    reads = {Impactor, Position, CollisionTarget, Enemy, Player, Static, Kinematic}
+    writes = set()
+    resource_writes = {Contacts}
+
+    def __init__(self, world):
+        super().__init__(world)
+        self.statics = StaticIndex(world)
+
     def update(self, dt: float):
-        # Reset flags
+        contacts = _get_contacts(self.world)
+        if contacts is None:
+            return
+        contacts.contacts.clear()
+
         impactors = self.world.get_matching_entities(
-            {Impactor, Position, CollisionTarget}
+            {Impactor, Position, CollisionTarget}, exclude={Kinematic}
         )
-        targets = self.world.get_matching_entities({Position, CollisionTarget})
-        for e in impactors:
-            imp = self.world.get_component(e, Impactor)
-            if imp:
-                imp.colliding = False
-                imp.colliding_with_enemy = False
-                imp.colliding_with_enemy_side = False
-                imp.colliding_with_enemy_top = False
-        for t in targets:
-            tcol = self.world.get_component(t, CollisionTarget)
-            if tcol:
-                tcol.colliding = False
-
-        # Mark overlaps
+        moving_targets = self.world.get_matching_entities(
+            {Position, CollisionTarget}, exclude={Static, Kinematic}
+        )
+
         for e in impactors:
             pos_a = self.world.get_component(e, Position)
             col_a = self.world.get_component(e, CollisionTarget)
-            if not (pos_a and col_a):
-                continue
             enemy_a = self.world.get_component(e, Enemy)
-            imp_a = self.world.get_component(e, Impactor)
-            for t in targets:
+            targets = self.statics.query(pos_a.x, pos_a.y, col_a.width, col_a.height)
+            for t in targets + moving_targets:
                 if t is e:
                     continue
                 pos_b = self.world.get_component(t, Position)
                 col_b = self.world.get_component(t, CollisionTarget)
-                if not (pos_b and col_b):
-                    continue
                 ax1, ay1 = pos_a.x, pos_a.y
                 ax2, ay2 = pos_a.x + col_a.width, pos_a.y + col_a.height
                 bx1, by1 = pos_b.x, pos_b.y
                 bx2, by2 = pos_b.x + col_b.width, pos_b.y + col_b.height
-                if ax1 < bx2 and ax2 > bx1 and ay1 < by2 and ay2 > by1:
-                    # Skip setting flags for enemy colliding with player
-                    # to avoid enemy pull and pushing
-                    if enemy_a is not None and self.world.get_component(t, Player):
-                        continue
-                    if imp_a:
-                        imp_a.colliding = True
-                        is_enemy_b = self.world.get_component(t, Enemy) is not None
-                        if is_enemy_b:
-                            imp_a.colliding_with_enemy = True
-                            # Determine side vs top overlap via axis test
-                            cx_a = pos_a.x + col_a.width / 2
-                            cy_a = pos_a.y + col_a.height / 2
-                            cx_b = pos_b.x + col_b.width / 2
-                            cy_b = pos_b.y + col_b.height / 2
-                            dx = cx_a - cx_b
-                            px = (col_a.width / 2 + col_b.width / 2) - abs(dx)
-                            dy = cy_a - cy_b
-                            py = (col_a.height / 2 + col_b.height / 2) - abs(dy)
-                            # Add small overlap threshold to avoid grazing registering as top
-                            min_overlap = min(col_a.height, col_b.height) * 0.1
-                            if py < px and dy < 0 and py > min_overlap:
-                                imp_a.colliding_with_enemy_top = True
-                            elif px < py and px > min_overlap:
-                                imp_a.colliding_with_enemy_side = True
-                    col_b.colliding = True
+                if not (ax1 < bx2 and ax2 > bx1 and ay1 < by2 and ay2 > by1):
+                    continue
+                # Skip enemies touching the player to avoid enemy pull and
+                # pushing; the player's own contact covers the pair
+                if enemy_a is not None and self.world.get_component(t, Player):
+                    continue
+
+                # Determine side vs top overlap via axis test
+                cx_a = pos_a.x + col_a.width / 2
+                cy_a = pos_a.y + col_a.height / 2
+                cx_b = pos_b.x + col_b.width / 2
+                cy_b = pos_b.y + col_b.height / 2
+                dx = cx_a - cx_b
+                px = (col_a.width / 2 + col_b.width / 2) - abs(dx)
+                dy = cy_a - cy_b
+                py = (col_a.height / 2 + col_b.height / 2) - abs(dy)
+                # Add small overlap threshold to avoid grazing registering as hit
+                min_overlap = min(col_a.height, col_b.height) * 0.1
+                if px < py:
+                    normal = (1, 0) if dx > 0 else (-1, 0)
+                    contact = Contact(e, t, normal, px, "side", px <= min_overlap)
+                elif dy < 0:
+                    contact = Contact(e, t, (0, -1), py, "top", py <= min_overlap)
+                else:
+                    contact = Contact(e, t, (0, 1), py, "bottom", py <= min_overlap)
+                contacts.contacts.append(contact)
 
 
 class EnemySpriteSystem(System):
+    reads = {WalkingAnimation, Enemy, CollisionTarget}
+    writes = {Sprite}
+
     def update(self, dt: float):
-        ents = self.world.get_matching_entities({WalkingAnimation, Sprite, Enemy})
+        # Only the enemies whose animation moved to another frame
+        ents = self.world.get_matching_entities(
+            {Changed[WalkingAnimation], Sprite, Enemy}, since=self.last_run
+        )
         for e in ents:
             anim = self.world.get_component(e, WalkingAnimation)
             sprite = self.world.get_component(e, Sprite)
@@ -738,40 +1510,38 @@ class EnemySpriteSystem(System):
 
 class ContactDamageSystem(System):
     def update(self, dt: float):
-        # Player damage based on flags with cooldown
-        players = self.world.get_matching_entities({Player, Lives, Impactor})
-        if not players:
-            return
-        p = players[0]
+        # Player damage based on contacts with cooldown
+        p = self.world.get_single(Player)
         lives = self.world.get_component(p, Lives)
-        imp = self.world.get_component(p, Impactor)
-        if not (lives and imp):
+        contacts = _get_contacts(self.world)
+        if not lives or contacts is None:
             return
         # cooldown countdown
         if lives.damage_timer > 0:
             lives.damage_timer = max(0.0, lives.damage_timer - dt)
         # apply damage only for side collisions with enemies
-        if (
-            imp.colliding_with_enemy
-            and imp.colliding_with_enemy_side
-            and not imp.colliding_with_enemy_top
-            and lives.damage_timer <= 0.0
-            and lives.hearts > 0
-        ):
+        side = top = False
+        for contact in contacts.contacts:
+            if (
+                contact.a == p
+                and not contact.grazing
+                and self.world.get_component(contact.b, Enemy)
+            ):
+                side = side or contact.kind == "side"
+                top = top or contact.kind == "top"
+        if side and not top and lives.damage_timer <= 0.0 and lives.hearts > 0:
             lives.hearts -= 1
             lives.damage_timer = 1.0
 
-        # Transition to game over when lives reach zero
         if lives.hearts <= 0:
-            global MENU_STATE
-            if MENU_STATE != "game_over":
-                MENU_STATE = "game_over"
-                _ensure_ui_world()
-                reset_ui_for_state()
-                apply_music_state()
+            self.world.publish(GameOver(p))
 
 
 class LandSoundSystem(System):
+    reads = set()
+    writes = {Player, Footsteps}
+    resource_writes = {AudioManager}
+
     def update(self, dt: float):
         entities = self.world.get_matching_entities({Player, Footsteps})
         for entity in entities:
@@ -786,35 +1556,96 @@ class LandSoundSystem(System):
                 player.landed = False
 
 
+class AudioSystem(System):
+    def update(self, dt: float):
+        # Play the sounds queued by the systems that ran before this one
+        audio = self.world.resources.get(AudioManager)
+        if audio is not None:
+            audio.flush(dt)
+
+
+class CameraSystem(System):
+    reads = {Position, CollisionTarget}
+    writes = {Camera}
+
+    def update(self, dt: float):
+        camera = _get_camera(self.world)
+        if camera is not None:
+            _center_camera(self.world, camera)
+
+
+class LevelStreamingSystem(System):
+    def update(self, dt: float):
+        _stream_chunks(self.world)
+
+
 class RenderSystem(System):
+    reads = set()
+    writes = set()
+
     def __init__(self, world):
         super().__init__(world)
+        self.statics = StaticIndex(world, Sprite)
 
     def draw(self):
-        drawable_entities = self.world.get_matching_entities({Position, Sprite})
+        camera = _get_camera(self.world)
+        cam_x = camera.x if camera else 0
+        cam_y = camera.y if camera else 0
+
+        # Static sprites (tiles) come from the index, only around the screen
+        drawable_entities = self.statics.query(
+            cam_x - TILE_SIZE,
+            cam_y - TILE_SIZE,
+            WIDTH + 2 * TILE_SIZE,
+            HEIGHT + 2 * TILE_SIZE,
+        )
+        drawable_entities += self.world.get_matching_entities(
+            {Position, Sprite}, exclude={Static}
+        )
         sprites = []
 
         for entity in drawable_entities:
             sprite = self.world.get_component(entity, Sprite)
             position = self.world.get_component(entity, Position)
+            parallax = self.world.get_component(entity, Parallax)
+
+            # Move to screen space
+            if parallax:
+                x = position.x - (cam_x * parallax.factor) % parallax.wrap
+                y = position.y
+            else:
+                x = position.x - cam_x
+                y = position.y - cam_y
+
+            # Skip what's off-screen, give or take the sprite's offset
+            margin = abs(sprite.offset[0]) + abs(sprite.offset[1])
+            if (
+                x - margin >= WIDTH
+                or y - margin >= HEIGHT
+                or x + sprite.width + margin <= 0
+                or y + sprite.height + margin <= 0
+            ):
+                continue
+
             flipx = self.world.get_component(entity, FlipX)
-            sprites.append((sprite.layer, position, sprite, flipx))
+            sprites.append((sprite.layer, x, y, sprite, flipx))
 
         # Sort by layer
         sprites.sort(key=lambda item: item[0])
 
-        for _, pos, sprite, flipx in sprites:
-            texture = getattr(images, sprite.texture, None)
+        textures = self.world.resources.get(Textures)
+        for _, x, y, sprite, flipx in sprites:
+            texture = textures.get(sprite.texture)
 
             if not texture:
                 screen.draw.rect(
-                    Rect(pos.x, pos.y, sprite.width, sprite.height),
+                    Rect(x, y, sprite.width, sprite.height),
                     (255, 0, 255),
                 )
                 continue
 
             if flipx and flipx.flip:
-                texture = pygame.transform.flip(texture, True, False)
+                texture = textures.get_flipped(sprite.texture)
 
             offset_x = sprite.offset[0]
             offset_y = sprite.offset[1]
@@ -822,18 +1653,18 @@ class RenderSystem(System):
             if flipx and flipx.flip and sprite.mirror_offset_on_flip:
                 offset_x = -offset_x
 
-            screen.blit(texture, (pos.x + offset_x, pos.y + offset_y))
+            screen.blit(texture, (x + offset_x, y + offset_y))
 
 
 class HUDSystem(System):
+    reads = set()
+    writes = set()
+
     def __init__(self, world):
         super().__init__(world)
 
     def draw(self):
-        players = self.world.get_matching_entities({Player, Lives})
-        if not players:
-            return
-        lives = self.world.get_component(players[0], Lives)
+        lives = self.world.get_component(self.world.get_single(Player), Lives)
         if not lives:
             return
 
@@ -863,6 +1694,136 @@ class HUDSystem(System):
                 )
 
 
+class FrameMonitor:
+    """
+    Keeps the times of the last frames, and of their update and draw, in
+    fixed-size ring buffers for the performance overlay.
+    """
+
+    def __init__(self, size: int):
+        self.frame = np.zeros(size)
+        self.update = np.zeros(size)
+        self.draw = np.zeros(size)
+        self.index = 0  # where the next frame goes
+        self.count = 0
+        self.visible = False
+
+    def add_update(self, dt: float, seconds: float):
+        self.frame[self.index] = dt
+        self.update[self.index] = seconds
+
+    def add_draw(self, seconds: float):
+        """Records the draw time, which ends the frame."""
+        self.draw[self.index] = seconds
+        self.index = (self.index + 1) % len(self.frame)
+        self.count = min(self.count + 1, len(self.frame))
+
+    def ordered(self, buffer: np.ndarray) -> np.ndarray:
+        """A buffer's recorded frames, oldest first."""
+        return np.roll(buffer, -self.index)[len(buffer) - self.count :]
+
+
+_frame_monitor = FrameMonitor(PERF_HUD_FRAMES)
+
+
+class PerfHUDSystem(System):
+    """
+    Draws the frame rate, frame times, update and draw times and entity
+    counts, toggled with F3. The overlay is redrawn into a cached surface a
+    few times per second, so keeping it on costs one blit per frame. Every
+    scene has one, but only the top scene's draws, and it reports on the
+    topmost scene that isn't an overlay, like the run under the pause menu.
+    """
+
+    reads = {InputQueue}
+    writes = set()
+
+    def __init__(self, world):
+        super().__init__(world)
+        self.surface: pygame.Surface | None = None
+        self.refresh_timer = 0.0
+
+    def update(self, dt: float):
+        for entity in self.world.get_matching_entities({InputQueue}):
+            if self.world.get_component(entity, InputQueue).was_pressed("perf_hud"):
+                _frame_monitor.visible = not _frame_monitor.visible
+                self.surface = None
+        self.refresh_timer -= dt
+
+    def draw(self):
+        if not _frame_monitor.visible or _scenes.top is None:
+            return
+        if _scenes.top.world is not self.world:
+            # Frozen under an overlay, whose own one is drawn instead
+            return
+        if self.surface is None or self.refresh_timer <= 0:
+            self.surface = self._render()
+            self.refresh_timer = PERF_HUD_REFRESH
+        screen.blit(self.surface, (WIDTH - PERF_HUD_WIDTH - 8, 8))
+
+    def _render(self) -> pygame.Surface:
+        monitor = _frame_monitor
+        frame = monitor.ordered(monitor.frame) * 1000
+        update = monitor.ordered(monitor.update) * 1000
+        draw = monitor.ordered(monitor.draw) * 1000
+        if not len(frame):
+            frame = update = draw = np.zeros(1)
+
+        world = self._subject()
+        enemies = len(world.components.get(Enemy, ()))
+        lines = [
+            f"FPS {1000 / max(frame.mean(), 1e-6):.0f}   "
+            f"frame {frame.mean():.1f} ms   max {frame.max():.1f} ms",
+            f"update {update.mean():.2f} ms   draw {draw.mean():.2f} ms",
+            f"entities {len(world.entities)}   enemies {enemies}",
+        ]
+        archetypes = sorted(world.archetypes().items(), key=lambda a: -a[1])
+        for types, count in archetypes[:PERF_HUD_ARCHETYPES]:
+            name = "+".join(sorted(t.__name__ for t in types)) or "(none)"
+            if len(name) > 34:
+                name = name[:33] + "…"
+            lines.append(f"{count:>4} {name}")
+
+        line_height = 16
+        graph_height = 48
+        graph_y = 6 + 3 * line_height + 4
+        height = graph_y + graph_height + 4 + (len(lines) - 3) * line_height + 6
+        surface = pygame.Surface((PERF_HUD_WIDTH, height), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+
+        # The lines change every redraw, so they're rendered, not kept
+        font = self.world.resources.get(Fonts).get(None, 16)
+        for i, line in enumerate(lines):
+            y = 6 + i * line_height
+            if i >= 3:
+                y += graph_height + 8
+            surface.blit(font.render(line, True, (255, 255, 255)), (6, y))
+
+        # One bar per frame, full height at 30 FPS, with a line at 60 FPS
+        bottom = graph_y + graph_height
+        for i, ms in enumerate(frame):
+            color = (
+                (90, 200, 90)
+                if ms <= 17
+                else (230, 200, 60) if ms <= 34 else (220, 60, 60)
+            )
+            bar = min(ms / (1000 / 30), 1.0) * graph_height
+            x = 6 + i * 2
+            pygame.draw.line(surface, color, (x, bottom), (x, bottom - bar))
+        target_y = bottom - graph_height / 2
+        pygame.draw.line(
+            surface, (200, 200, 200), (6, target_y), (PERF_HUD_WIDTH - 6, target_y)
+        )
+        return surface
+
+    def _subject(self) -> World:
+        """The world of the topmost scene that isn't an overlay."""
+        for scene in reversed(_scenes.stack):
+            if not scene.overlay:
+                return scene.world
+        return self.world
+
+
 class DeathCleanupSystem(System):
     def update(self, dt: float):
         # Timer-based cleanup (backward compatible)
@@ -891,64 +1852,206 @@ class DeathCleanupSystem(System):
 # region Game
 
 
+_system_executor: ThreadPoolExecutor | None = None
+
+
+def _get_system_executor() -> ThreadPoolExecutor | None:
+    """Returns the thread pool shared by every game world, if enabled."""
+    global _system_executor
+
+    if SYSTEM_THREADS > 0 and _system_executor is None:
+        _system_executor = ThreadPoolExecutor(
+            max_workers=SYSTEM_THREADS, thread_name_prefix="systems"
+        )
+    return _system_executor
+
+
 class Game:
-    def __init__(self):
-        self.world = World()
+    def __init__(
+        self,
+        input_queue: InputQueue | None = None,
+        seed: int | None = None,
+        build: bool = True,
+    ):
+        """
+        Creates a run. With 'build' False, the world is left empty to be built
+        a few steps at a time by 'build', e.g. while the menu is showing.
+        """
+        # Every random decision of a run derives from its seed
+        self.seed = seed if seed is not None else random.randrange(2**63)
+        self.rng = random.Random(self.seed)
+        self.recorder: InputLog | None = None
+        self.world = World(_get_system_executor(), _scenes.resources)
+        self.world.profiler = _alloc_profiler
         self.player = None
         self.input = Controls()
+        self.input_queue = input_queue or InputQueue(ACTION_BINDINGS)
+        self.ready = False
+        self._build_steps = self._steps()
+        if build:
+            self.build()
 
+    def build(self, budget: float | None = None) -> bool:
+        """
+        Runs build steps until the world is complete or, if given, 'budget'
+        seconds have passed. Returns whether the world is complete.
+        """
+        deadline = None if budget is None else time.perf_counter() + budget
+        while not self.ready:
+            try:
+                next(self._build_steps)
+            except StopIteration:
+                self.ready = True
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        return self.ready
+
+    def _steps(self):
+        """Builds the world, yielding between steps."""
         # Add global difficulty entity
-        difficulty = self.world.create_entity()
-        self.world.add_component(difficulty, Difficulty())
+        self.difficulty = self.world.create_entity()
+        self.world.add_component(self.difficulty, Difficulty())
+        spawner_rng = random.Random(self.rng.getrandbits(64))
+        self.world.add_component(self.difficulty, EnemySpawner(spawner_rng))
+
+        # Add global input entity
+        input_entity = self.world.create_entity()
+        self.world.add_component(input_entity, self.input_queue)
+
+        # Add the contacts, rebuilt every frame
+        self.world.resources.insert(Contacts())
+        yield
 
         # Add systems
-        self.world.add_system(ControlsSystem(self.world))
-        self.world.add_system(GravitySystem(self.world))
-        self.world.add_system(MovementSystem(self.world))
-        self.world.add_system(CollisionDetectionSystem(self.world))
-        self.world.add_system(CombatSystem(self.world))
-        self.world.add_system(CollisionResolutionSystem(self.world))
-        self.world.add_system(LandSoundSystem(self.world))
-        self.world.add_system(DifficultySystem(self.world))
-        self.world.add_system(EnemySpawnSystem(self.world))
-        self.world.add_system(EnemyAIChase(self.world))
-        self.world.add_system(WalkingAnimationSystem(self.world))
-        self.world.add_system(EnemySpriteSystem(self.world))
-        self.world.add_system(ContactDamageSystem(self.world))
-        self.world.add_system(FootstepSystem(self.world))
-        self.world.add_system(DeathCleanupSystem(self.world))
-        self.world.add_system(RenderSystem(self.world))
-        self.world.add_system(CursorSystem(self.world))
-        self.world.add_system(HUDSystem(self.world))
+        for system_type in (
+            InputSystem,
+            ControlsSystem,
+            SleepSystem,
+            GravitySystem,
+            MovementSystem,
+            CollisionDetectionSystem,
+            CombatSystem,
+            CollisionResolutionSystem,
+            LandSoundSystem,
+            DifficultySystem,
+            EnemySpawnSystem,
+            EnemyAIChase,
+            WalkingAnimationSystem,
+            EnemySpriteSystem,
+            ContactDamageSystem,
+            FootstepSystem,
+            DeathCleanupSystem,
+            CameraSystem,
+            LevelStreamingSystem,
+            AudioSystem,
+            RenderSystem,
+            HUDSystem,
+            PerfHUDSystem,
+        ):
+            self.world.add_system(system_type(self.world))
+            yield
 
         self._create_background()
+        yield
         self._create_map()
         self._create_player()
-        # Cursor entity for in-game
-        cur = self.world.create_entity()
-        self.world.add_component(cur, Cursor("default"))
+        yield
+        self._create_camera()
+        yield
+
+        # Load the textures drawn so far and animated to, so the first frames
+        # of the run don't wait on the disk
+        textures = set(LEVEL.textures)
+        for entity in self.world.get_matching_entities({Sprite}):
+            textures.add(self.world.get_component(entity, Sprite).texture)
+        for entity in self.world.get_matching_entities({WalkingAnimation}):
+            textures.update(self.world.get_component(entity, WalkingAnimation).frames)
+        for texture in sorted(textures):
+            getattr(images, texture, None)
+            yield
+
+    def reset(self, seed: int | None = None):
+        """
+        Starts a new run in place. Systems, background and map are kept, only
+        the player, enemies, difficulty and spawner go back to their initial
+        state, exactly as in a new Game created with the same seed.
+        """
+        self.seed = seed if seed is not None else random.randrange(2**63)
+        self.rng = random.Random(self.seed)
+        self.recorder = None
+
+        for enemy in self.world.get_matching_entities({Blinky}):
+            self.world.destroy_entity(enemy)
+
+        difficulty = self.world.get_component(self.difficulty, Difficulty)
+        difficulty.elapsed = 0.0
+        difficulty.speed_multiplier = 1.0
+        spawner = self.world.get_component(self.difficulty, EnemySpawner)
+        spawner.timer = 0.0
+        spawner.spawned = 0
+        spawner.rng.seed(self.rng.getrandbits(64))
+
+        self.world.destroy_entity(self.player)
+        self.input = Controls()
+        self._create_player()
+
+        # Stream the level around the new player: the chunks it keeps stay
+        # built, and the enemies of the ones left behind are dropped
+        streamer = self.world.get_component(self.level, LevelStreamer)
+        streamer.dormant.clear()
+        camera = self.world.get_component(self.camera, Camera)
+        camera.target = self.player
+        _center_camera(self.world, camera)
+        _stream_chunks(self.world)
 
     def update(self, dt):
         self.world.update(dt)
+        if self.recorder is not None:
+            self.recorder.append(dt, self.input)
 
     def draw(self):
         self.world.draw()
 
-    def _get_random_dirt_texture(self):
-        roll = random.random()
-        if roll < 0.09:
-            return "tile_green_08"
-        elif roll < 0.2:
-            return "tile_green_17"
-        return "tile_green_03"
+    def snapshot(self) -> bytes:
+        """Captures the state of the run, see World.snapshot."""
+        return self.world.snapshot()
+
+    def restore(self, data: bytes):
+        """Rolls the run back to a snapshot taken by 'snapshot'."""
+        self.world.restore(data)
+        # The player's Controls was rebuilt, keep 'input' pointing at it
+        controls = self.world.get_component(self.player, Controls)
+        if controls is not None:
+            self.input = controls
+
+    def record(self) -> "InputLog":
+        """Starts recording the input of every following tick."""
+        self.recorder = InputLog(self.seed)
+        return self.recorder
+
+    def state_digest(self) -> str:
+        """Hash of the simulation state, used to check replays."""
+        digest = hashlib.sha256()
+        for entity in self.world.get_matching_entities({Position, Velocity}):
+            pos = self.world.get_component(entity, Position)
+            vel = self.world.get_component(entity, Velocity)
+            digest.update(struct.pack("<4d", pos.x, pos.y, vel.vx, vel.vy))
+        for entity in self.world.get_matching_entities({Lives}):
+            lives = self.world.get_component(entity, Lives)
+            digest.update(struct.pack("<id", lives.hearts, lives.damage_timer))
+        for entity in self.world.get_matching_entities({Difficulty}):
+            d = self.world.get_component(entity, Difficulty)
+            digest.update(struct.pack("<2d", d.elapsed, d.speed_multiplier))
+        return digest.hexdigest()
 
     def _create_background(self):
         """
-        Repeat background, hills, and tiles to fill the screen
+        Repeat background, hills, and tiles to fill the screen, with one extra
+        column to scroll into. The further the layer, the slower it scrolls.
         """
         width = BACKGROUND_WIDTH
         height = BACKGROUND_HEIGHT
-        cols = WIDTH // width + 1
+        cols = WIDTH // width + 2
         rows = HEIGHT // height + 1
 
         for r in range(rows):
@@ -961,57 +2064,37 @@ class Game:
                 self.world.add_component(
                     bg, Sprite("set2_background", width, height, layer=-30)
                 )
+                self.world.add_component(bg, Parallax(0.0, width))
 
                 hills = self.world.create_entity()
                 self.world.add_component(hills, Position(x, y))
                 self.world.add_component(
                     hills, Sprite("set2_hills", width, height, layer=-20)
                 )
+                self.world.add_component(hills, Parallax(0.25, width))
 
                 tiles = self.world.create_entity()
                 self.world.add_component(tiles, Position(x, y))
                 self.world.add_component(
                     tiles, Sprite("set2_tiles", width, height, layer=-10)
                 )
+                self.world.add_component(tiles, Parallax(0.5, width))
 
     def _create_map(self):
         """
-        Create a platform of grass starting a little below the middle
-        (1 tile on top), and fill all rows below with dirt (with rare
-        variations).
+        Create the level streamer, which builds the level chunk by chunk
+        around the camera, and pick the player's spawn.
         """
-        random.seed(42)
-
-        cols = WIDTH // TILE_SIZE + 1
-        grass_row = (HEIGHT // TILE_SIZE) - 3  # 3 rows above the bottom
-        global GROUND_TOP_Y
-        GROUND_TOP_Y = grass_row * TILE_SIZE
-
-        # Create the grass row
-        for c in range(cols):
-            x = c * TILE_SIZE
-            grass = self.world.create_entity()
-            self.world.add_component(grass, Position(x, grass_row * TILE_SIZE))
-            self.world.add_component(grass, CollisionTarget(TILE_SIZE, TILE_SIZE))
-            self.world.add_component(
-                grass, Sprite("tile_green_05", TILE_SIZE, TILE_SIZE)
-            )
+        self.level = self.world.create_entity()
+        self.world.add_component(self.level, LevelStreamer())
+        self.player_spawn = LEVEL.spawn
 
-        # Fill the dirt rows below the grass to the bottom of the screen
-        for r in range(grass_row + 1, HEIGHT // TILE_SIZE + 1):
-            for c in range(cols):
-                x = c * TILE_SIZE
-                y = r * TILE_SIZE
-                dirt = self.world.create_entity()
-                self.world.add_component(dirt, Position(x, y))
-                self.world.add_component(dirt, CollisionTarget(TILE_SIZE, TILE_SIZE))
-                tex = self._get_random_dirt_texture()
-                self.world.add_component(dirt, Sprite(tex, TILE_SIZE, TILE_SIZE))
-
-        # Spawn the player on top of the grass, in the middle of the screen
-        spawn_x = WIDTH // 2
-        spawn_y = grass_row * TILE_SIZE - (PLAYER_HEIGHT // 2) - 1
-        self.player_spawn = (spawn_x, spawn_y)
+    def _create_camera(self):
+        self.camera = self.world.create_entity()
+        camera = Camera(self.player)
+        self.world.add_component(self.camera, camera)
+        _center_camera(self.world, camera)
+        _stream_chunks(self.world)
 
     def _create_player(self):
         self.player = self.world.create_entity()
@@ -1019,7 +2102,8 @@ class Game:
         self.world.add_component(self.player, Position(spawn_x, spawn_y))
         self.world.add_component(self.player, Velocity(0, 0))
         self.world.add_component(self.player, Gravity(GRAVITY))
-        self.world.add_component(self.player, Impactor())
+        self.world.add_component(self.player, Sleeper())
+        self.world.add_component(self.player, Impactor(ccd=True))
         self.world.add_component(
             self.player, CollisionTarget(PLAYER_WIDTH, PLAYER_HEIGHT)
         )
@@ -1068,22 +2152,136 @@ class Game:
                     "footstep_wood_003",
                     "footstep_wood_004",
                 ],
+                rng=random.Random(self.rng.getrandbits(64)),
             ),
         )
 
 
-# region Menu
+# region Replay
 
-MENU_STATE = "menu"  # "menu" | "game" | "game_over"
 
-pygame.mouse.set_visible(False)
+class InputLog:
+    """
+    Compact binary log of a run: its seed, then the dt and control bits of
+    every tick. Replaying it through Game.update reproduces the run exactly.
+    """
 
+    MAGIC = b"WBRL"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHQI")  # magic, version, seed, tick count
+    TICK = struct.Struct("<dB")  # dt, control bits
+    LEFT, RIGHT, JUMP = 1, 2, 4
 
-def play_click_sound():
-    if not SFX_ENABLED:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.ticks = bytearray()
+        self.digest = b""  # state digest at the end of the log, if known
+
+    def __len__(self) -> int:
+        return len(self.ticks) // self.TICK.size
+
+    def __iter__(self):
+        for dt, bits in self.TICK.iter_unpack(self.ticks):
+            left = bool(bits & self.LEFT)
+            right = bool(bits & self.RIGHT)
+            jump = bool(bits & self.JUMP)
+            yield dt, left, right, jump
+
+    def append(self, dt: float, controls: "Controls"):
+        bits = 0
+        if controls.left:
+            bits |= self.LEFT
+        if controls.right:
+            bits |= self.RIGHT
+        if controls.jump:
+            bits |= self.JUMP
+        self.ticks += self.TICK.pack(dt, bits)
+
+    def save(self, path: str):
+        """Writes the log to a new file, never over an existing one."""
+        with open(path, "xb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.seed, len(self)))
+            f.write(self.ticks)
+            f.write(self.digest)
+
+    @classmethod
+    def load(cls, path: str) -> "InputLog":
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path} is not a Wibblo input log")
+        log = cls(seed)
+        start = cls.HEADER.size
+        end = start + count * cls.TICK.size
+        log.ticks = bytearray(data[start:end])
+        log.digest = data[end:]
+        return log
+
+
+def replay(log: InputLog, input_queue: InputQueue | None = None) -> Game:
+    """Runs a recorded log through a fresh Game and returns it."""
+    game = Game(input_queue, seed=log.seed)
+    game.input.scripted = True
+    for dt, left, right, jump in log:
+        game.input.left = left
+        game.input.right = right
+        game.input.jump = jump
+        game.update(dt)
+    return game
+
+
+def _save_recording():
+    """Writes the current run's input log into RECORD_DIR."""
+    if not RECORD_DIR or _game is None or _game.recorder is None:
+        return
+    log = _game.recorder
+    _game.recorder = None
+    if not len(log):
+        return
+    log.digest = _game.state_digest().encode()
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("run_%Y%m%d_%H%M%S", time.localtime(now))
+    stamp += f"_{int(now * 1000) % 1000:03d}"
+    # Count up rather than overwrite a run saved within the same millisecond
+    for attempt in itertools.count():
+        suffix = f"_{attempt}" if attempt else ""
+        try:
+            log.save(os.path.join(RECORD_DIR, f"{stamp}{suffix}.wbl"))
+            return
+        except FileExistsError:
+            pass
+
+
+atexit.register(_save_recording)
+
+
+def _save_run_stats():
+    """Adds the finished run to the high scores and statistics."""
+    if _game is None:
         return
+    world = _game.world
+    elapsed = world.get_component(_game.difficulty, Difficulty).elapsed
+    kills = world.get_component(_game.player, Player).kills
+    _save_data.set("runs", _save_data.get("runs", 0) + 1)
+    _save_data.set("total_time", _save_data.get("total_time", 0.0) + elapsed)
+    _save_data.set("total_kills", _save_data.get("total_kills", 0) + kills)
+    _save_data.set("best_time", max(_save_data.get("best_time", 0.0), elapsed))
+    _save_data.set("best_kills", max(_save_data.get("best_kills", 0), kills))
 
-    sounds.click5.play()
+
+# endregion
+
+
+# region Menu
+
+if not HEADLESS:
+    pygame.mouse.set_visible(False)
+
+
+def play_click_sound():
+    _audio.play("click5")
 
 
 def play_footstep_sound(footsteps):
@@ -1097,15 +2295,12 @@ def play_footstep_sound(footsteps):
         idx = footsteps.rng.randrange(count)
         if idx == footsteps.last_index:
             idx = (idx + 1) % count
-    name = names[idx]
-    sound_obj = getattr(sounds, name, None)
-    if sound_obj:
-        footsteps.sound_index = idx
-        footsteps.last_index = idx
-        sound_obj.play()
+    footsteps.sound_index = idx
+    footsteps.last_index = idx
+    _audio.play(names[idx], group="footstep")
 
 
-class UIRect(Component):
+class UIRect(Component, tracked=("x", "y", "w", "h")):
     def __init__(self, x: int, y: int, w: int, h: int):
         self.x = x
         self.y = y
@@ -1117,7 +2312,9 @@ class UIRect(Component):
         return self.x <= px <= self.x + self.w and self.y <= py <= self.y + self.h
 
 
-class UIButton(Component):
+class UIButton(
+    Component, tracked=("label", "label_color", "texture_normal", "texture_pressed")
+):
     def __init__(
         self,
         label: str,
@@ -1138,7 +2335,7 @@ class Hoverable(Component):
         pass
 
 
-class Pressable(Component):
+class Pressable(Component, tracked=("is_pressed",)):
     def __init__(self):
         self.is_pressed = False
 
@@ -1160,11 +2357,15 @@ class UIButtonLabelSystem(System):
 class UIButtonInputSystem(System):
     def update(self, dt: float):
         # Consume queued clicks
-        global MENU_STATE, MUSIC_ENABLED, SFX_ENABLED, _game
-        downs = list(_ui_mouse_downs)
-        ups = list(_ui_mouse_ups)
-        _ui_mouse_downs.clear()
-        _ui_mouse_ups.clear()
+        downs = []
+        ups = []
+        for entity in self.world.get_matching_entities({InputQueue}):
+            input_queue = self.world.get_component(entity, InputQueue)
+            for event in input_queue.events_for("click"):
+                if event.kind == MOUSE_DOWN:
+                    downs.append(event.pos)
+                elif event.kind == MOUSE_UP:
+                    ups.append(event.pos)
 
         # Prepare button list
         ents = self.world.get_matching_entities({UIRect, UIButton, Pressable})
@@ -1194,71 +2395,61 @@ class UIButtonInputSystem(System):
                     target = btn
                 prs.is_pressed = False
             if target:
-                if target.action == "start":
-                    MENU_STATE = "game"
-                    if _game is None:
-                        _create_game()
-                    apply_music_state()
-                elif target.action == "toggle_music":
-                    MUSIC_ENABLED = not MUSIC_ENABLED
-                    apply_music_state()
-                elif target.action == "toggle_sfx":
-                    SFX_ENABLED = not SFX_ENABLED
-                elif target.action == "exit":
-                    quit()
-                elif target.action == "restart":
-                    MENU_STATE = "game"
-                    _game = None
-                    _create_game()
-                    apply_music_state()
-                elif target.action == "menu":
-                    MENU_STATE = "menu"
-                    _game = None
-                    _ensure_ui_world()
-                    reset_ui_for_state()
-                    apply_music_state()
+                self.world.publish(ButtonPressed(target.action))
 
 
 class UIDrawSystem(System):
-    def __init__(self, world):
+    def __init__(self, world, kind: str):
         super().__init__(world)
+        self.kind = kind
         self.background_tiles_normal = []
         self.background_tiles_game_over = []
-        self.generate_background_tiles_normal()
-        self.generate_background_tiles_game_over()
+        self.shade: pygame.Surface | None = None
+        if kind == "menu":
+            self.generate_background_tiles_normal()
+        elif kind == "game_over":
+            self.generate_background_tiles_game_over()
+        else:
+            # Darkens the frozen game drawn below
+            self.shade = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            self.shade.fill((0, 0, 0, 140))
+        # Button textures scaled to their rects, by button entity
+        self.button_textures: Dict[Entity, pygame.Surface] = {}
+
+    def update(self, dt: float):
+        # Rescale the textures of the buttons that changed, when next drawn
+        for filters in (Changed[UIButton], Changed[Pressable], Changed[UIRect]):
+            for e in self.world.get_matching_entities({filters}, since=self.last_run):
+                self.button_textures.pop(e, None)
+        for e in list(self.button_textures):
+            if e not in self.world.entities:
+                del self.button_textures[e]
 
     def draw(self):
-        screen.clear()
-        GRAY = (120, 120, 120)
-        screen.fill(GRAY)
+        if self.shade is not None:
+            screen.blit(self.shade, (0, 0))
+        else:
+            screen.clear()
+            GRAY = (120, 120, 120)
+            screen.fill(GRAY)
 
         # Draw background tiles
-        if MENU_STATE == "game_over":
-            for tile in self.background_tiles_game_over:
-                screen.blit(tile[2], (tile[0], tile[1]))
-        else:
-            for tile in self.background_tiles_normal:
-                screen.blit(tile[2], (tile[0], tile[1]))
+        for tile in self.background_tiles_normal + self.background_tiles_game_over:
+            screen.blit(tile[2], (tile[0], tile[1]))
 
         # Title
-        if MENU_STATE == "game_over":
+        fonts = self.world.resources.get(Fonts)
+        if self.kind == "game_over":
             RED = (220, 60, 60)
-            screen.draw.text(
-                "Game Over",
-                center=(WIDTH // 2, 140),
-                fontname="kenney_future",
-                fontsize=64,
-                color=RED,
-            )
+            self._draw_text(fonts.render("Game Over", 64, RED), (WIDTH // 2, 140))
+            best = f"Recorde: {_save_data.get('best_time', 0.0):.1f}s"
+            self._draw_text(fonts.render(best, 24, RED), (WIDTH // 2, 200))
+        elif self.kind == "pause":
+            WHITE = (255, 255, 255)
+            self._draw_text(fonts.render("Pausa", 64, WHITE), (WIDTH // 2, 140))
         else:
             BLACK = (0, 0, 0)
-            screen.draw.text(
-                TITLE,
-                center=(WIDTH // 2, 140),
-                fontname="kenney_future",
-                fontsize=64,
-                color=BLACK,
-            )
+            self._draw_text(fonts.render(TITLE, 64, BLACK), (WIDTH // 2, 140))
 
         # Buttons
         ents = self.world.get_matching_entities({UIRect, UIButton})
@@ -1271,28 +2462,27 @@ class UIDrawSystem(System):
             r = Rect(rect.x, rect.y, rect.w, rect.h)
 
             # Texture
-            texture_name = (
-                button.texture_pressed
-                if (pressable and pressable.is_pressed)
-                else button.texture_normal
-            )
-            texture = getattr(images, texture_name, None)
+            scaled = self.button_textures.get(e)
+            if scaled is None:
+                texture_name = (
+                    button.texture_pressed
+                    if (pressable and pressable.is_pressed)
+                    else button.texture_normal
+                )
+                textures = self.world.resources.get(Textures)
+                scaled = textures.get_scaled(texture_name, r.w, r.h)
+                self.button_textures[e] = scaled
 
             # Draw texture
-            try:
-                scaled = pygame.transform.smoothscale(texture, (r.w, r.h))
-            except Exception:
-                scaled = texture
-            screen.blit(scaled, (r.x, r.y))
+            if scaled is not None:
+                screen.blit(scaled, (r.x, r.y))
 
             # Label
-            screen.draw.text(
-                button.label,
-                center=r.center,
-                fontname="kenney_future",
-                fontsize=24,
-                color=button.label_color,
-            )
+            label = fonts.render(button.label, 24, button.label_color)
+            self._draw_text(label, r.center)
+
+    def _draw_text(self, text: pygame.Surface, center: Tuple[int, int]):
+        screen.blit(text, text.get_rect(center=center))
 
     def generate_background_tiles_normal(self):
         if not self.background_tiles_normal:
@@ -1337,10 +2527,7 @@ class UIHoverSystem(System):
             return
 
         # Default to normal cursor
-        cursor_entities = self.world.get_matching_entities({Cursor})
-        if not cursor_entities:
-            return
-        cursor = self.world.get_component(cursor_entities[0], Cursor)
+        cursor = self.world.resources.get(Cursor)
         if not cursor:
             return
         cursor.cursor_type = "default"
@@ -1355,92 +2542,122 @@ class UIHoverSystem(System):
                 break
 
 
-class CursorSystem(System):
-    def __init__(self, world):
+def draw_cursor():
+    """Draws the cursor shared by every scene, over all of them."""
+    cursor = _scenes.resources.get(Cursor)
+    if not pygame.mouse.get_focused():
+        return
+
+    image_name = (
+        "cursor_pointer" if cursor.cursor_type == "pointer" else "cursor_default"
+    )
+    texture = _scenes.resources.get(Textures).get(image_name)
+    mouse_x, mouse_y = pygame.mouse.get_pos()
+
+    if texture:
+        screen.blit(texture, (mouse_x - CURSOR_SIZE // 2, mouse_y - CURSOR_SIZE // 2))
+    else:
+        screen.draw.filled_circle(
+            (mouse_x - CURSOR_SIZE // 2, mouse_y - CURSOR_SIZE // 2),
+            CURSOR_SIZE,
+            (255, 255, 255),
+        )
+
+
+# The input queue shared by every world
+_input = InputQueue(ACTION_BINDINGS)
+
+
+class UIScene(Scene):
+    """
+    A screen of buttons, by kind: "menu", "game_over" or "pause". Each is
+    built the first time it shows and kept, see _ui_scene.
+    """
+
+    def __init__(self, kind: str):
+        world = World(resources=_scenes.resources)
+        world.profiler = _alloc_profiler
+        world.add_system(InputSystem(world))
+        world.add_system(UIButtonLabelSystem(world))
+        world.add_system(UIButtonInputSystem(world))
+        world.add_system(AudioSystem(world))
+        world.add_system(UIDrawSystem(world, kind))
+        world.add_system(UIHoverSystem(world))
+        world.add_system(PerfHUDSystem(world))
+        world.subscribe(ButtonPressed, self._on_button_pressed)
+
+        input_entity = world.create_entity()
+        world.add_component(input_entity, _input)
+        create_layout(world, kind)
+
         super().__init__(world)
-        self._hide_cursor()
+        self.kind = kind
 
-    def draw(self):
-        entities = self.world.get_matching_entities({Cursor})
-        if not entities:
-            return
-        entity = entities[0]
-        cursor = self.world.get_component(entity, Cursor)
-        if not cursor:
-            return
+    def enter(self):
+        apply_music_state()
 
-        if not pygame.mouse.get_focused():
-            return
+    def _on_button_pressed(self, events: List[ButtonPressed]):
+        for event in events:
+            if _scenes.top is not self:
+                # An earlier button already left this screen
+                return
+            _run_button_action(event.action)
 
-        image_name = (
-            "cursor_pointer" if cursor.cursor_type == "pointer" else "cursor_default"
-        )
-        texture = getattr(images, image_name, None)
-        mouse_x, mouse_y = pygame.mouse.get_pos()
 
-        if texture:
-            screen.blit(
-                texture, (mouse_x - CURSOR_SIZE // 2, mouse_y - CURSOR_SIZE // 2)
-            )
-        else:
-            screen.draw.filled_circle(
-                (mouse_x - CURSOR_SIZE // 2, mouse_y - CURSOR_SIZE // 2),
-                CURSOR_SIZE,
-                (255, 255, 255),
-            )
+class MenuScene(UIScene):
+    """The menu or the game over screen, behind which the next run is built."""
+
+    def update(self, dt: float):
+        super().update(dt)
+        # Unless a run was just started from here
+        if _scenes.top is self:
+            _prepare_game()
 
-    def _hide_cursor(self):
-        try:
-            pygame.mouse.set_visible(False)
-        except Exception:
-            pass
 
+class PauseScene(UIScene):
+    """The pause menu, over the frozen run."""
 
-# UI world and click queue
-_ui_world: World | None = None
-_ui_mouse_downs: List[Tuple[int, int]] = []
-_ui_mouse_ups: List[Tuple[int, int]] = []
+    overlay = True
 
+    def __init__(self):
+        super().__init__("pause")
 
-def _ensure_ui_world():
-    global _ui_world
+    def update(self, dt: float):
+        super().update(dt)
+        if _scenes.top is self and _input.was_pressed("pause"):
+            _scenes.pop()
 
-    if _ui_world is not None:
-        return
-    _ui_world = World()
-    _ui_world.add_system(UIButtonLabelSystem(_ui_world))
-    _ui_world.add_system(UIButtonInputSystem(_ui_world))
-    _ui_world.add_system(UIDrawSystem(_ui_world))
-    _ui_world.add_system(UIHoverSystem(_ui_world))
-    _ui_world.add_system(CursorSystem(_ui_world))
 
-    create_layout()
+# UI scenes by kind, see _ui_scene
+_ui_scenes: Dict[str, UIScene] = {}
 
-    # UI cursor entity (default type)
-    cur = _ui_world.create_entity()
-    _ui_world.add_component(cur, Cursor("default"))
 
+def _ui_scene(kind: str) -> UIScene:
+    """The scene of a kind of screen, built the first time it's asked for."""
+    if kind not in _ui_scenes:
+        _ui_scenes[kind] = PauseScene() if kind == "pause" else MenuScene(kind)
+        _startup_trace.mark("ui world")
+    return _ui_scenes[kind]
 
-def create_layout():
-    global _ui_world
-    if _ui_world is None:
-        return
-    # If buttons already exist, don't recreate
-    if _ui_world.get_matching_entities({UIButton}):
-        return
 
+def create_layout(world: World, kind: str):
     BUTTONS_DIV_GAP = 8
     TITLE_MB = 32
 
     button_width = BUTTON_WIDTH * 1.5
     button_height = BUTTON_HEIGHT
 
-    # Configure buttons for current UI state
-    if MENU_STATE == "game_over":
+    # Configure buttons for the kind of screen
+    if kind == "game_over":
         buttons_spec = [
             ("Reiniciar", "restart"),
             ("Menu", "menu"),
         ]
+    elif kind == "pause":
+        buttons_spec = [
+            ("Continuar", "resume"),
+            ("Menu", "menu"),
+        ]
     else:
         buttons_spec = [
             ("Começar", "start"),
@@ -1456,9 +2673,9 @@ def create_layout():
     x = (WIDTH - button_width) // 2
 
     def add_button(y: int, label: str, action: str):
-        e = _ui_world.create_entity()
-        _ui_world.add_component(e, UIRect(x, y, button_width, button_height))
-        _ui_world.add_component(
+        e = world.create_entity()
+        world.add_component(e, UIRect(x, y, button_width, button_height))
+        world.add_component(
             e,
             UIButton(
                 label,
@@ -1467,97 +2684,361 @@ def create_layout():
                 texture_pressed="button_rectangle_depth",
             ),
         )
-        _ui_world.add_component(e, Hoverable())
-        _ui_world.add_component(e, Pressable())
+        world.add_component(e, Hoverable())
+        world.add_component(e, Pressable())
 
     for i, (label, action) in enumerate(buttons_spec):
         add_button(base_y + i * (button_height + BUTTONS_DIV_GAP), label, action)
 
 
-def reset_ui_for_state():
-    global _ui_world
-    if _ui_world is None:
-        return
-    # Remove existing UI button entities
-    ents = _ui_world.get_matching_entities({UIButton})
-    for e in ents:
-        _ui_world.destroy_entity(e)
-    # Recreate the layout for the current state
-    create_layout()
+def _ogg_duration(path: str) -> float:
+    """
+    Returns the length in seconds of an Ogg Vorbis file by reading only its
+    identification header and the granule position of its last page.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(64)
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - 65536, 0))
+            tail = f.read()
+    except OSError:
+        return 0.0
+    ident = head.find(b"\x01vorbis")
+    last_page = tail.rfind(b"OggS")
+    if ident < 0 or last_page < 0 or len(tail) < last_page + 14:
+        return 0.0
+    (rate,) = struct.unpack_from("<I", head, ident + 12)
+    (granule,) = struct.unpack_from("<q", tail, last_page + 6)
+    if rate <= 0 or granule <= 0:
+        return 0.0
+    return granule / rate
+
+
+class MusicPlayer:
+    """
+    Streams music tracks from the music/ directory with pygame.mixer.music, so
+    only the playing track is decoded. Switching tracks fades the current one
+    out before the next one fades in, and each track resumes where it was left.
+    """
+
+    def __init__(self, fade: float = MUSIC_FADE_TIME):
+        self.fade = fade
+        self.track: str | None = None
+        self.pending: str | None = None
+        self.pending_resume = True
+        self.positions: Dict[str, float] = {}
+        self._lengths: Dict[str, float] = {}
+        self._start = 0.0
+        self._fade_timer = 0.0
+
+    def play(self, track: str, resume: bool = True):
+        """Fades to 'track', resuming from its last position if 'resume'."""
+        if self.pending is None and track == self.track:
+            return
+        if self.pending is not None:
+            # Still fading out the previous track, just retarget the switch
+            self.pending = track
+            self.pending_resume = resume
+            return
+        if self.track is None:
+            self._start_track(track, resume)
+            return
+        self._fade_out()
+        self.pending = track
+        self.pending_resume = resume
 
+    def stop(self):
+        """Fades out the current track and forgets any pending switch."""
+        self.pending = None
+        if self.track is not None:
+            self._fade_out()
+
+    def update(self, dt: float):
+        if self._fade_timer <= 0:
+            return
+        self._fade_timer -= dt
+        if self._fade_timer <= 0 and self.pending is not None:
+            track = self.pending
+            self.pending = None
+            self._start_track(track, self.pending_resume)
+
+    def _path(self, track: str) -> str:
+        return os.path.join(pgzero.loaders.root, MUSIC_DIR, f"{track}.ogg")
+
+    def _position(self) -> float:
+        try:
+            played = pygame.mixer.music.get_pos()
+        except pygame.error:
+            return 0.0
+        if played < 0:
+            return self._start
+        return self._start + played / 1000
+
+    def _fade_out(self):
+        if self.track is not None:
+            self.positions[self.track] = self._position()
+        try:
+            pygame.mixer.music.fadeout(int(self.fade * 1000))
+        except pygame.error:
+            pass
+        self.track = None
+        self._fade_timer = self.fade
+
+    def _start_track(self, track: str, resume: bool):
+        path = self._path(track)
+        start = self.positions.get(track, 0.0) if resume else 0.0
+        if track not in self._lengths:
+            self._lengths[track] = _ogg_duration(path)
+        length = self._lengths[track]
+        start = start % length if length > 0 else 0.0
+        fade_ms = int(self.fade * 1000)
+        try:
+            pygame.mixer.music.load(path)
+            try:
+                pygame.mixer.music.play(-1, start=start, fade_ms=fade_ms)
+            except pygame.error:
+                # Seeking unsupported for this file, play from the beginning
+                start = 0.0
+                pygame.mixer.music.play(-1, fade_ms=fade_ms)
+        except pygame.error:
+            return
+        self.track = track
+        self._start = start
 
-def apply_music_state():
-    try:
-        # Stop both first to avoid overlap
-        sounds.music_space_cadet.stop()
-        sounds.music_sad_descent.stop()
-        sounds.music_game_over.stop()
-    except Exception:
-        pass
 
+_music_player = MusicPlayer()
+
+
+def apply_music_state():
+    """Plays the track of the topmost scene with one, the menu's at startup."""
     if not MUSIC_ENABLED:
+        _music_player.stop()
         return
 
-    try:
-        if MENU_STATE == "menu":
-            sounds.music_space_cadet.play(-1)
-        elif MENU_STATE == "game_over":
-            sounds.music_game_over.play(-1)
-        else:
-            sounds.music_sad_descent.play(-1)
-    except Exception:
-        pass
+    kinds = [scene.kind for scene in reversed(_scenes.stack)] or ["menu"]
+    for kind in kinds:
+        if kind in SCENE_MUSIC:
+            track, resume = SCENE_MUSIC[kind]
+            _music_player.play(track, resume=resume)
+            return
 
 
+_startup_trace.mark("definitions")
+
 # Apply initial music state
 apply_music_state()
+_startup_trace.mark("music")
 
 # endregion
 
-# Global game instance created on demand
+
+class GameScene(Scene):
+    """The run being played, frozen while the pause menu is over it."""
+
+    kind = "game"
+
+    def __init__(self, game: Game):
+        super().__init__(game.world)
+        self.game = game
+
+    def enter(self):
+        _scenes.resources.get(Cursor).cursor_type = "default"
+        apply_music_state()
+        if GC_POLICY == "manual":
+            gc.disable()
+
+    def exit(self):
+        _gc_safe_point()
+
+    def pause(self):
+        _gc_safe_point()
+
+    def resume(self):
+        self.enter()
+
+    def update(self, dt: float):
+        self.game.update(dt)
+        if _scenes.top is not self:
+            # The run just ended
+            return
+        if self.game.input_queue.was_pressed("pause"):
+            _scenes.push(_ui_scene("pause"))
+        elif not gc.isenabled() and gc.get_count()[0] > GC_YOUNG_LIMIT:
+            # Only the youngest objects, which is quick, in case a run piles
+            # up reference cycles
+            gc.collect(0)
+
+    def draw(self):
+        self.game.draw()
+
+
+# The Game of the current or next run, built behind the menu, and its scene
 _game: Game | None = None
+_game_scene: GameScene | None = None
+# Whether _game was played since it was built or reset
+_game_played = False
 
 
 def _create_game():
-    global _game
-    _game = Game()
+    global _game, _game_scene, _game_played
+    _game = Game(_input, build=False)
+    _game.world.subscribe(GameOver, _on_game_over)
+    _game_scene = GameScene(_game)
+    _game_played = False
+
+
+def _prepare_game():
+    """
+    Gets the next run's Game ready while the menu shows, building it a step
+    at a time or resetting the one just played.
+    """
+    global _game_played
+
+    if _game is None:
+        _create_game()
+    if not _game.ready:
+        if _game.build(GAME_BUILD_BUDGET):
+            _gc_freeze()
+    elif _game_played:
+        _save_recording()
+        _game.reset()
+        _game_played = False
+
+
+def _start_run():
+    """
+    Starts a new run on the Game prepared behind the menu, finishing it first
+    if the menu didn't show long enough.
+    """
+    global _game_played
+
+    _save_recording()
+    if _game is None:
+        _create_game()
+    _game.build()
+    if _game_played:
+        _game.reset()
+    _game_played = True
+    if RECORD_DIR:
+        _game.record()
+    _scenes.switch(_game_scene)
+
+
+def _on_game_over(events: List[GameOver]):
+    """Ends the run and shows the game over screen."""
+    if _scenes.top is not _game_scene:
+        return
+    _save_run_stats()
+    # The recording is saved behind the game over screen, see _prepare_game,
+    # once the tick that ended the run is in it
+    _scenes.switch(_ui_scene("game_over"))
+
+
+def _run_button_action(action: str):
+    global MUSIC_ENABLED, SFX_ENABLED
+
+    if action in ("start", "restart"):
+        _start_run()
+    elif action == "resume":
+        _scenes.pop()
+    elif action == "toggle_music":
+        MUSIC_ENABLED = not MUSIC_ENABLED
+        _save_data.set("music_enabled", MUSIC_ENABLED)
+        apply_music_state()
+    elif action == "toggle_sfx":
+        SFX_ENABLED = not SFX_ENABLED
+        _save_data.set("sfx_enabled", SFX_ENABLED)
+    elif action == "exit":
+        quit()
+    elif action == "menu":
+        _save_recording()
+        _scenes.switch(_ui_scene("menu"))
+
+
+def _gc_freeze():
+    """
+    Collects, then leaves everything still alive, like what was just loaded,
+    out of every later collection.
+    """
+    if GC_POLICY == "manual":
+        gc.collect()
+        gc.freeze()
+
+
+def _gc_safe_point():
+    """Collects now that a hitch goes unnoticed, and lets the collector run."""
+    if GC_POLICY == "manual":
+        gc.collect()
+        gc.enable()
+
+
+def _write_alloc_trace():
+    if _alloc_profiler is not None:
+        with open(ALLOC_TRACE, "w") as f:
+            f.write(_alloc_profiler.report())
+
+
+atexit.register(_write_alloc_trace)
 
 
 # Pygame Zero hooks
 
 
+# Whether the time to the first frame was reported
+_first_frame_drawn = False
+
+
 def draw():
-    if MENU_STATE in ("menu", "game_over"):
-        _ensure_ui_world()
-        _ui_world.draw()
-    else:
-        if _game:
-            _game.draw()
+    global _first_frame_drawn
+
+    started = time.perf_counter()
+    _scenes.draw()
+    draw_cursor()
+    _frame_monitor.add_draw(time.perf_counter() - started)
+
+    if not _first_frame_drawn:
+        _first_frame_drawn = True
+        _startup_trace.mark("first frame")
+        _startup_trace.write()
+        elapsed = time.perf_counter() - STARTED
+        print(f"First frame drawn {elapsed * 1000:.0f}ms after start", flush=True)
 
 
 def update(dt):
-    if MENU_STATE in ("menu", "game_over"):
-        _ensure_ui_world()
-        _ui_world.update(dt)
-        return
-    if _game:
-        _game.update(dt)
+    # pgzero sets up the window and audio between the module and first update
+    _startup_trace.mark("pygame window")
+    started = time.perf_counter()
+    _update(dt)
+    _frame_monitor.add_update(dt, time.perf_counter() - started)
 
 
-def on_mouse_down(pos):
-    global MENU_STATE, MUSIC_ENABLED, SFX_ENABLED, _game
-    if MENU_STATE not in ("menu", "game_over"):
-        return
-    _ui_mouse_downs.append(pos)
+def _update(dt):
+    _music_player.update(dt)
+    if _scenes.top is None:
+        # The window is up, show the menu
+        _scenes.push(_ui_scene("menu"))
+    _scenes.update(dt)
 
 
-def on_mouse_up(pos):
-    global MENU_STATE
-    if MENU_STATE not in ("menu", "game_over"):
-        return
-    _ui_mouse_ups.append(pos)
+def on_mouse_down(pos, button):
+    _input.push(MOUSE_DOWN, button, pos)
+
+
+def on_mouse_up(pos, button):
+    _input.push(MOUSE_UP, button, pos)
+
+
+def on_key_down(key):
+    _input.push(KEY_DOWN, key)
+
+
+def on_key_up(key):
+    _input.push(KEY_UP, key)
 
 
+_gc_freeze()
 pgzrun.go()
 
 # endregion
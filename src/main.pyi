@@ -1,3 +1,5 @@
 from typing import Any
 
 keyboard: Any
+keys: Any
+mouse: Any
@@ -0,0 +1,224 @@
+"""
+Keeps small save data, like settings, high scores and statistics, as an
+append-only log of key/value records. Every change appends one record, so a
+crash can at worst tear the last one, which is detected by its checksum and
+dropped on the next load. The log is read through a memory map and rewritten
+with only the latest value of each key once it grows too long.
+
+Writes happen on a background thread, so setting a value never blocks the
+caller on disk I/O.
+"""
+
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+MAGIC = b"WSAV"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+# payload size, crc32 of the payload
+RECORD_HEADER = struct.Struct("<II")
+
+# Compact once the log is this many times bigger than its live records
+COMPACT_RATIO = 4
+COMPACT_MIN_SIZE = 16 * 1024
+
+
+def user_data_dir(app: str) -> str:
+    """The directory where the platform keeps an application's user data."""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, app)
+
+
+def _encode_record(key: str, value: Any) -> bytes:
+    payload = json.dumps([key, value], separators=(",", ":")).encode()
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(data) -> Tuple[Dict[str, Any], Dict[str, int], int]:
+    """
+    Replays the records of a log. Returns the latest value and record size of
+    each key, and where the valid records end.
+    """
+    values: Dict[str, Any] = {}
+    sizes: Dict[str, int] = {}
+    if len(data) < FILE_HEADER.size:
+        return values, sizes, 0
+    magic, version = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a save data file")
+
+    pos = FILE_HEADER.size
+    while pos + RECORD_HEADER.size <= len(data):
+        size, crc = RECORD_HEADER.unpack_from(data, pos)
+        start = pos + RECORD_HEADER.size
+        payload = data[start : start + size]
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            break
+        key, value = json.loads(payload)
+        values[key] = value
+        sizes[key] = RECORD_HEADER.size + size
+        pos = start + size
+    return values, sizes, pos
+
+
+class SaveData:
+    """
+    Save data backed by the log at 'path', or kept in memory only when 'path'
+    is None. Values must be JSON-serializable.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.values: Dict[str, Any] = {}
+        self._sizes: Dict[str, int] = {}
+        self._file_size = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        # Guards 'values' between the caller and the writer's compaction
+        self._lock = threading.Lock()
+        if path is None:
+            return
+
+        self._load()
+        if self.path is None:
+            return
+        self._thread = threading.Thread(
+            target=self._write_loop, name="savedata", daemon=True
+        )
+        self._thread.start()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def set(self, key: str, value: Any):
+        """Sets a value now and queues its record for the writer."""
+        if key in self.values and self.values[key] == value:
+            return
+        with self._lock:
+            self.values[key] = value
+        if self._thread is not None:
+            self._queue.put((key, value))
+
+    def flush(self):
+        """Waits until every queued record is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Writes the queued records and stops the writer."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    values, sizes, end = _read_records(data)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # Unreadable: start over rather than refuse to run
+            values, sizes, end, size = {}, {}, 0, 0
+            try:
+                os.replace(self.path, self.path + ".bad")
+            except OSError:
+                # Can't even be moved aside, e.g. read-only: keep to memory
+                self.path = None
+                return
+
+        self.values = values
+        self._sizes = sizes
+        self._file_size = end
+        if end < size:
+            # Drop a record torn by a crash, so new ones follow valid data
+            try:
+                os.truncate(self.path, end)
+            except OSError:
+                # New records would follow the torn one and be lost on the
+                # next load, e.g. if read-only: keep to memory
+                self.path = None
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch: List[Tuple[str, Any]] = []
+            done = item is None
+            if not done:
+                batch.append(item)
+            # Write everything queued so far in one go
+            while not self._queue.empty():
+                item = self._queue.get()
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+            try:
+                if batch:
+                    self._append(batch)
+            except OSError:
+                pass
+            for _ in range(len(batch) + done):
+                self._queue.task_done()
+            if done:
+                return
+
+    def _append(self, batch: List[Tuple[str, Any]]):
+        assert self.path is not None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = bytearray()
+        if self._file_size == 0:
+            data.extend(FILE_HEADER.pack(MAGIC, VERSION))
+        for key, value in batch:
+            record = _encode_record(key, value)
+            self._sizes[key] = len(record)
+            data.extend(record)
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._file_size += len(data)
+
+        live_size = FILE_HEADER.size + sum(self._sizes.values())
+        if (
+            self._file_size > COMPACT_MIN_SIZE
+            and self._file_size > live_size * COMPACT_RATIO
+        ):
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the log with one record per key, replacing it atomically."""
+        assert self.path is not None
+        with self._lock:
+            values = dict(self.values)
+        data = bytearray(FILE_HEADER.pack(MAGIC, VERSION))
+        sizes = {}
+        for key, value in values.items():
+            record = _encode_record(key, value)
+            sizes[key] = len(record)
+            data.extend(record)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._sizes = sizes
+        self._file_size = len(data)
@@ -0,0 +1,219 @@
+"""
+Plays many headless games in parallel to tune the difficulty. Each run has
+its own seed and a scripted player, and is simulated with a fixed dt as fast
+as the CPU allows. For example, to compare two spawn intervals and two
+difficulty ramps over 200 runs each:
+
+    python src/simfarm.py --runs 200 --spawn-interval 2.5 3.0 --ramp 0.02 0.03
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import headless
+
+POLICIES = ("idle", "random", "dodge")
+
+# The Game of each worker process, reset between runs
+_game = None
+
+
+def _nearest_enemy(game_module, game, x: float):
+    world = game.world
+    nearest = None
+    nearest_dx = 0.0
+    for enemy in world.get_matching_entities({game_module.Enemy, game_module.Position}):
+        dx = world.get_component(enemy, game_module.Position).x - x
+        if nearest is None or abs(dx) < abs(nearest_dx):
+            nearest = enemy
+            nearest_dx = dx
+    return nearest, nearest_dx
+
+
+def _steer(game_module, game, policy: str, rng: random.Random):
+    """Sets the player's controls for the next tick."""
+    controls = game.input
+    controls.left = controls.right = controls.jump = False
+    if policy == "idle":
+        return
+    if policy == "random":
+        move = rng.random()
+        controls.left = move < 0.3
+        controls.right = 0.3 <= move < 0.6
+        controls.jump = rng.random() < 0.05
+        return
+
+    # Dodge: run from enemies and jump on the ones that get close
+    pos = game.world.get_component(game.player, game_module.Position)
+    enemy, dx = _nearest_enemy(game_module, game, pos.x)
+    if enemy is None:
+        return
+    if abs(dx) < 160:
+        controls.jump = True
+        controls.left = dx > 0
+        controls.right = dx < 0
+    elif abs(dx) < 320:
+        controls.left = dx > 0
+        controls.right = dx < 0
+
+
+def run_once(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Plays one run to the end and returns its statistics."""
+    global _game
+
+    game_module = headless.load_game()
+    if _game is None:
+        _game = game_module.Game(seed=params["seed"])
+    else:
+        _game.reset(params["seed"])
+    game = _game
+    game.input.scripted = True
+
+    world = game.world
+    difficulty = world.get_component(game.difficulty, game_module.Difficulty)
+    difficulty.ramp = params["ramp"]
+    spawner = world.get_component(game.difficulty, game_module.EnemySpawner)
+    spawner.interval = params["spawn_interval"]
+    lives = world.get_component(game.player, game_module.Lives)
+
+    rng = random.Random(params["seed"])
+    dt = params["dt"]
+    max_ticks = int(params["max_time"] / dt)
+    tick_times = []
+    peak_enemies = 0
+    started = time.perf_counter()
+    for _ in range(max_ticks):
+        if lives.hearts <= 0:
+            break
+        _steer(game_module, game, params["policy"], rng)
+        tick_start = time.perf_counter()
+        game.update(dt)
+        tick_times.append(time.perf_counter() - tick_start)
+        enemies = len(world.components[game_module.Enemy])
+        peak_enemies = max(peak_enemies, enemies)
+    wall = time.perf_counter() - started
+
+    alive = len(world.components[game_module.Enemy])
+    tick_times.sort()
+    return {
+        **params,
+        "survived": difficulty.elapsed,
+        "died": lives.hearts <= 0,
+        "spawned": spawner.spawned,
+        "kills": spawner.spawned - alive,
+        "peak_enemies": peak_enemies,
+        "tick_mean_us": statistics.fmean(tick_times) * 1e6 if tick_times else 0.0,
+        "tick_p99_us": (
+            tick_times[int(len(tick_times) * 0.99)] * 1e6 if tick_times else 0.0
+        ),
+        "wall": wall,
+    }
+
+
+def summarize(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aggregates the runs that share the same parameters."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for result in results:
+        key = (result["ramp"], result["spawn_interval"], result["policy"])
+        groups.setdefault(key, []).append(result)
+
+    rows = []
+    for (ramp, interval, policy), runs in sorted(groups.items()):
+        survived = sorted(run["survived"] for run in runs)
+        rows.append(
+            {
+                "ramp": ramp,
+                "spawn_interval": interval,
+                "policy": policy,
+                "runs": len(runs),
+                "survived_mean": statistics.fmean(survived),
+                "survived_p50": survived[len(survived) // 2],
+                "survived_p90": survived[int(len(survived) * 0.9)],
+                "deaths": sum(run["died"] for run in runs),
+                "kills_mean": statistics.fmean(run["kills"] for run in runs),
+                "peak_enemies": max(run["peak_enemies"] for run in runs),
+                "tick_mean_us": statistics.fmean(run["tick_mean_us"] for run in runs),
+                "tick_p99_us": max(run["tick_p99_us"] for run in runs),
+                "speedup": sum(survived) / max(sum(run["wall"] for run in runs), 1e-9),
+            }
+        )
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]):
+    header = (
+        f"{'ramp':>6} {'spawn':>6} {'policy':>7} {'runs':>5} {'surv':>7} "
+        f"{'p50':>7} {'p90':>7} {'deaths':>6} {'kills':>6} {'peak':>5} "
+        f"{'tick us':>8} {'p99 us':>8} {'speed':>7}"
+    )
+    print(header)
+    for row in rows:
+        print(
+            f"{row['ramp']:>6.3f} {row['spawn_interval']:>6.2f} {row['policy']:>7} "
+            f"{row['runs']:>5} {row['survived_mean']:>7.1f} "
+            f"{row['survived_p50']:>7.1f} {row['survived_p90']:>7.1f} "
+            f"{row['deaths']:>6} {row['kills_mean']:>6.1f} "
+            f"{row['peak_enemies']:>5} {row['tick_mean_us']:>8.0f} "
+            f"{row['tick_p99_us']:>8.0f} {row['speedup']:>6.0f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless Wibblo games.")
+    parser.add_argument("--runs", type=int, default=50, help="runs per setting")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--max-time", type=float, default=300.0, help="seconds")
+    parser.add_argument("--dt", type=float, default=1 / 60)
+    parser.add_argument("--ramp", type=float, nargs="+", default=[None])
+    parser.add_argument("--spawn-interval", type=float, nargs="+", default=[None])
+    parser.add_argument("--policy", choices=POLICIES, nargs="+", default=["dodge"])
+    parser.add_argument("--json", help="also write every run's results here")
+    args = parser.parse_args()
+
+    game_module = headless.load_game()
+    ramps = [r if r is not None else game_module.DIFFICULTY_RAMP for r in args.ramp]
+    intervals = [
+        i if i is not None else game_module.ENEMY_SPAWN_INTERVAL
+        for i in args.spawn_interval
+    ]
+
+    jobs = []
+    seeds = itertools.count(args.seed)
+    for ramp, interval, policy in itertools.product(ramps, intervals, args.policy):
+        for _ in range(args.runs):
+            jobs.append(
+                {
+                    "seed": next(seeds),
+                    "ramp": ramp,
+                    "spawn_interval": interval,
+                    "policy": policy,
+                    "max_time": args.max_time,
+                    "dt": args.dt,
+                }
+            )
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        chunksize = max(len(jobs) // (args.workers * 4), 1)
+        results = list(executor.map(run_once, jobs, chunksize=chunksize))
+    wall = time.perf_counter() - started
+
+    print_report(summarize(results))
+    simulated = sum(result["survived"] for result in results)
+    print(f"\n{len(results)} runs, {simulated:.0f}s simulated in {wall:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Traces the game's startup, phase by phase, to find the slowest steps. Each
+phase records its wall time and its memory allocations, and the trace is
+written to a file once the first frame is drawn. To trace a run from source,
+including the imports of main.py:
+
+    python src/startup.py startup_trace.txt
+
+A build is traced by setting WIBBLO_STARTUP_TRACE to the file to write.
+Tracing allocations slows everything down, and the trace's own work is left
+out of the phases, so compare traces with each other, not with the time to
+first frame of an untraced run.
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple
+
+TRACE_ENV = "WIBBLO_STARTUP_TRACE"
+
+# Allocation sites listed for each phase
+TOP_SITES = 3
+
+
+class Phase:
+    def __init__(self, name: str, seconds: float, allocated: int, peak: int):
+        self.name = name
+        self.seconds = seconds
+        self.allocated = allocated  # net bytes still allocated at its end
+        self.peak = peak  # highest bytes allocated above its start
+        self.sites: List[Tuple[str, int]] = []
+
+
+class StartupTrace:
+    """
+    Splits startup into phases, each ending where it's marked. Does nothing
+    when 'path' is None.
+    """
+
+    def __init__(self, path: str | None, started: float):
+        self.path = path
+        self.started = started
+        self.phases: List[Phase] = []
+        self._last = started
+        self._memory = 0
+        self._snapshot = None
+        if path is None:
+            return
+        if not tracemalloc.is_tracing():
+            # Too late to see what was allocated before
+            tracemalloc.start()
+            self._snapshot = self._take_snapshot()
+            self._memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def mark(self, name: str):
+        """Ends the phase 'name'. Only its first mark counts."""
+        if self.path is None or any(phase.name == name for phase in self.phases):
+            return
+        now = time.perf_counter()
+        memory, peak = tracemalloc.get_traced_memory()
+        phase = Phase(
+            name, now - self._last, memory - self._memory, peak - self._memory
+        )
+
+        snapshot = self._take_snapshot()
+        if self._snapshot is None:
+            stats = [
+                (stat.traceback[0], stat.size)
+                for stat in snapshot.statistics("lineno")[:TOP_SITES]
+            ]
+        else:
+            stats = [
+                (stat.traceback[0], stat.size_diff)
+                for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP_SITES]
+            ]
+        for frame, size in stats:
+            phase.sites.append((f"{frame.filename}:{frame.lineno}", size))
+        self.phases.append(phase)
+
+        self._snapshot = snapshot
+        # Leave the tracer's own time and memory out of the next phase
+        self._memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self._last = time.perf_counter()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        # Leave out the allocations of the tracing itself
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ]
+        )
+
+    def write(self):
+        """Writes the trace, slowest phases first, and stops tracing."""
+        if self.path is None:
+            return
+        total = sum(phase.seconds for phase in self.phases)
+        with open(self.path, "w") as f:
+            f.write(f"{'phase':<16} {'ms':>8} {'%':>5} {'alloc KiB':>10} ")
+            f.write(f"{'peak KiB':>10}\n")
+            for phase in sorted(self.phases, key=lambda p: -p.seconds):
+                f.write(
+                    f"{phase.name:<16} {phase.seconds * 1000:>8.1f} "
+                    f"{phase.seconds / max(total, 1e-9) * 100:>5.1f} "
+                    f"{phase.allocated / 1024:>10.1f} {phase.peak / 1024:>10.1f}\n"
+                )
+                for site, size in phase.sites:
+                    f.write(f"    {size / 1024:>+10.1f} KiB  {site}\n")
+            f.write(f"{'total':<16} {total * 1000:>8.1f}\n")
+        self.path = None
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace the startup of Wibblo.")
+    parser.add_argument("output", help="file to write the trace to")
+    args = parser.parse_args()
+
+    # Start before main.py imports anything, as the build's runtime hook does
+    setattr(sys, "_wibblo_started", time.perf_counter())
+    tracemalloc.start()
+    os.environ[TRACE_ENV] = args.output
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    sys.argv = [main_path]
+    runpy.run_path(main_path, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
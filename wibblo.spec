@@ -1,41 +1,54 @@
 # -*- mode: python ; coding: utf-8 -*-
-from PyInstaller.utils.hooks import collect_all
+# Built as one directory rather than one file, so launching doesn't unpack
+# everything into a temporary directory first. See build.sh for the steps.
+from PyInstaller.utils.hooks import collect_data_files
 
-datas = [('src/images', 'images'), ('src/sounds', 'sounds'), ('src/fonts', 'fonts')]
-binaries = []
-hiddenimports = []
-tmp_ret = collect_all('pgzero')
-datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
+# Levels ship compiled only; their sources aren't read by the game
+datas = [('src/images', 'images'), ('src/sounds', 'sounds'), ('src/music', 'music'), ('src/fonts', 'fonts'), ('src/levels/*.lvl', 'levels')]
+# pgzero's own modules are found by the import analysis, only its data isn't
+datas += collect_data_files('pgzero')
+
+# Never imported by the game, but pulled in by the analysis
+excludes = [
+    'asyncio',
+    'doctest',
+    'lib2to3',
+    'numpy.f2py',
+    'numpy.testing',
+    'pdb',
+    'pydoc',
+    'sqlite3',
+    'ssl',
+    'tkinter',
+    'unittest',
+]
 
 
 a = Analysis(
     ['src/main.py'],
-    pathex=[],
-    binaries=binaries,
+    pathex=['src'],
+    binaries=[],
     datas=datas,
-    hiddenimports=hiddenimports,
+    hiddenimports=[],
     hookspath=[],
     hooksconfig={},
-    runtime_hooks=[],
-    excludes=[],
+    runtime_hooks=['devops/pyinstaller/startup_hook.py'],
+    excludes=excludes,
     noarchive=False,
-    optimize=0,
+    optimize=2,
 )
 pyz = PYZ(a.pure)
 
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='wibblo',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -43,3 +56,11 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    name='wibblo',
+)